@@ -225,6 +225,5 @@ def main():
     print("\nWrote " + str(RowCounter) + " records")
 
 
-main()
-
-
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+#!Python
+
+# Benchmark harness for UniTrunker_XML2CSV.
+#
+# Generates realistic synthetic Unitrunker.xml files and times how the
+# converter scales - XML parsing, the Radio ID filtering and each output
+# writer - reporting wall time, records per second and peak memory.
+# Results can be saved as a baseline and later runs compared against it
+# so regressions stand out.
+#
+#   python benchmark.py generate bench.xml --users 1000000
+#   python benchmark.py run bench.xml --save-baseline bench_baseline.json
+#   python benchmark.py run bench.xml --baseline bench_baseline.json
+#   python benchmark.py run --users 10000,100000,1000000
+#
+# Each stage runs in its own process so its peak memory is measured on
+# its own.
+
+
+from datetime import datetime, timedelta
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from unitrunker_xml2csv import columnar
+from unitrunker_xml2csv.export import convert
+from unitrunker_xml2csv.records import iter_records
+from unitrunker_xml2csv.rules import default_rules, exclusions, genericRids, prepare_group, prepare_radio
+from unitrunker_xml2csv.settings import settings as defaultSettings
+from unitrunker_xml2csv.sinks import OutputSink, last_date, last_dsd, outputSinks
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)  # bytes on macOS
+    return peak / 1024  # kilobytes elsewhere
+
+
+# Synthetic data.
+
+serviceWords = ['FIRE', 'RFS', 'SES', 'AMBO', 'POLICE', 'RAIL', 'ROADS', 'PARKS', 'WATER', 'COUNCIL']
+labelWords = ['OPS', 'DISPATCH', 'TAC', 'NORTH', 'SOUTH', 'EAST', 'WEST', 'CMD', 'SUPPORT', 'LOGISTICS']
+
+
+def random_rid(rng):
+
+    # Spread RIDs across the ranges include_rid() and check_label() handle:
+    # generic service ranges, encrypted and noise exclusions and the rest.
+
+    choice = rng.random()
+    if choice < 0.45:
+        info = rng.choice(list(genericRids.values()))
+    elif choice < 0.65:
+        info = rng.choice(list(exclusions.values()))
+    else:
+        return rng.randint(10000, 16777215)
+    return rng.randint(int(info['rangeStart']), int(info['rangeEnd']))
+
+
+def random_last(rng, now):
+    heard = now - timedelta(seconds=rng.randint(0, 400 * 24 * 3600))
+    return heard.strftime('%Y%m%d%H%M%S')
+
+
+def attribute_text(name, value):
+    value = value.replace('&', '&amp;').replace('"', '&quot;').replace('<', '&lt;')
+    return ' ' + name + '="' + value + '"'
+
+
+def generate(xmlFile, systems=1, groups=2000, users=100000, seed=1):
+
+    # Write a synthetic Unitrunker.xml with the given number of Systems and
+    # Groups and Users per System. Every attribute main() reads is filled
+    # in some of the time, the same as a real database. Written line by
+    # line so millions of Users don't need much memory.
+
+    rng = random.Random(seed)
+    now = datetime.now()
+
+    with open(xmlFile, 'w', encoding='utf-8', buffering=1 << 20) as xml:
+        xml.write('<?xml version="1.0" encoding="UTF-8"?>\n<Unitrunker version="1">\n')
+
+        for system in range(systems):
+            xml.write('<System type="P25" id="' + str(system + 1) + '" label="System ' + str(system + 1)
+                      + '" wacn="BEE00" sysid="' + format(0x2D1 + system, 'X') + '">\n')
+
+            for site in range(1, 4):
+                xml.write('<Site id="' + str(site) + '" label="Site ' + str(site) + '">\n')
+                for channel in range(4):
+                    hz = 850000000 + rng.randint(0, 8000) * 6250
+                    control = ' control="1"' if channel == 0 else ''
+                    xml.write('<Channel id="' + str(channel) + '" hz="' + str(hz) + '"' + control + '/>\n')
+                xml.write('</Site>\n')
+
+            for group in rng.sample(range(1, 65535), min(groups, 65534)):
+                line = '<Group' + attribute_text('id', str(group))
+                if rng.random() < 0.8:
+                    line += attribute_text('brief', rng.choice(serviceWords))
+                if rng.random() < 0.85:
+                    line += attribute_text('label', rng.choice(labelWords) + ' ' + str(rng.randint(1, 99)))
+                if rng.random() < 0.95:
+                    line += attribute_text('last', random_last(rng, now))
+                if rng.random() < 0.1:
+                    line += attribute_text('notes', 'Heard on ' + rng.choice(labelWords).lower() + ' & patch')
+                line += attribute_text('hits', str(int(rng.paretovariate(1.2) * 10)))
+                xml.write(line + '/>\n')
+
+            seen = set()  # One User per RID in a System, as in Unitrunker
+            for user in range(users):
+                rid = random_rid(rng)
+                while rid in seen:
+                    rid = random_rid(rng)
+                seen.add(rid)
+                line = '<User' + attribute_text('id', str(rid))
+                if rng.random() < 0.35:
+                    line += attribute_text('label', rng.choice(serviceWords) + ' ' + str(rng.randint(1, 999)))
+                if rng.random() < 0.2:
+                    line += attribute_text('brief', rng.choice(labelWords))
+                if rng.random() < 0.97:
+                    line += attribute_text('last', random_last(rng, now))
+                if rng.random() < 0.05:
+                    line += attribute_text('notes', 'Unit ' + str(user))
+                line += attribute_text('hits', str(int(rng.paretovariate(1.1) * 5)))
+                xml.write(line + '/>\n')
+
+            xml.write('</System>\n')
+
+        xml.write('</Unitrunker>\n')
+
+
+# Benchmark stages. Each one runs in a fresh process and returns
+# (seconds, records, peak RSS in MB).
+
+def prepared_records(xmlFile, createGenericRids):
+    # (kind, record, exported) as the export would hand them to a sink
+    prepared = []
+    for record in iter_records(xmlFile):
+        if record.kind == 'Group':
+            tg = prepare_group(record)
+            if tg is not None:
+                prepared.append(('Group', tg, True))
+        elif record.kind == 'User':
+            radio, exported = prepare_radio(record, createGenericRids)
+            if radio is not None:
+                prepared.append(('User', radio, exported))
+        elif record.kind == 'Channel':
+            prepared.append(('Channel', record, True))
+    return prepared
+
+
+def run_stage(stage, xmlFile, workFolder, createGenericRids):
+
+    os.chdir(workFolder)
+
+    if stage == 'parse':
+        start = time.perf_counter()
+        records = 0
+        for record in iter_records(xmlFile):
+            records = records + 1
+        seconds = time.perf_counter() - start
+
+    elif stage == 'filter':
+        records = list(iter_records(xmlFile))
+        default_rules()
+        start = time.perf_counter()
+        for record in records:
+            if record.kind == 'Group':
+                prepare_group(record)
+            elif record.kind == 'User':
+                radio, exported = prepare_radio(record, createGenericRids)
+                if radio is not None:
+                    # The dates the Radio ID outputs need
+                    last_date(radio)
+                    last_dsd(radio)
+        seconds = time.perf_counter() - start
+        records = len(records)
+
+    elif stage == 'filter:columnar':
+        records = list(iter_records(xmlFile))
+        start = time.perf_counter()
+        for record, prepared in columnar.iter_prepared(records, createGenericRids):
+            if record.kind == 'Group':
+                prepare_group(record)
+            elif record.kind == 'User' and prepared[0] is not None:
+                last_date(prepared[0])
+                last_dsd(prepared[0])
+        seconds = time.perf_counter() - start
+        records = len(records)
+
+    elif stage == 'convert' or stage == 'convert:pipeline':
+        settings = dict(defaultSettings, createGenericRids=createGenericRids,
+                        pipeline='yes' if stage == 'convert:pipeline' else 'no')
+        records = sum(1 for record in iter_records(xmlFile))
+        start = time.perf_counter()
+        convert(xmlFile, settings)
+        seconds = time.perf_counter() - start
+
+    else:
+        # One output writer on its own, fed records that are already prepared
+        key = stage.split(':', 1)[1]
+        prepared = prepared_records(xmlFile, createGenericRids)
+        sink = outputSinks[key](defaultSettings)
+        if type(sink).channel is not OutputSink.channel:
+            # The frequency writers only take the Site Channels
+            prepared = [item for item in prepared if item[0] == 'Channel']
+        start = time.perf_counter()
+        sink.open(sink.output_name('bench'))
+        for kind, record, exported in prepared:
+            if kind == 'Group':
+                sink.group(record)
+            elif kind == 'User':
+                sink.radio(record, exported)
+            else:
+                sink.channel(record)
+        sink.close()
+        seconds = time.perf_counter() - start
+        records = len(prepared)
+
+    return seconds, records, peak_rss_mb()
+
+
+def benchmark(xmlFile, stages, repeat=1, createGenericRids='yes'):
+
+    # Time each stage, keeping the best of repeat runs.
+
+    results = {}
+    workFolder = tempfile.mkdtemp(prefix='xml2csv_bench_')
+    xmlFile = os.path.abspath(xmlFile)
+    context = multiprocessing.get_context('spawn')
+
+    try:
+        for stage in stages:
+            best = None
+            for attempt in range(repeat):
+                with context.Pool(1) as pool:
+                    result = pool.apply(run_stage, (stage, xmlFile, workFolder, createGenericRids))
+                if best is None or result[0] < best[0]:
+                    best = result
+            seconds, records, peakMb = best
+            results[stage] = {
+                'seconds': round(seconds, 4),
+                'records': records,
+                'recordsPerSecond': round(records / seconds) if seconds else None,
+                'peakRssMb': round(peakMb, 1) if peakMb is not None else None,
+            }
+            print(format_result(stage, results[stage]))
+    finally:
+        shutil.rmtree(workFolder, ignore_errors=True)
+
+    return results
+
+
+def format_result(stage, result, change=None):
+    line = (stage.ljust(24) + str(result['seconds']).rjust(10) + ' s'
+            + str(result['records']).rjust(11) + ' recs'
+            + str(result['recordsPerSecond']).rjust(11) + ' recs/s'
+            + str(result['peakRssMb']).rjust(9) + ' MB')
+    if change is not None:
+        line += change
+    return line
+
+
+def compare(results, baseline, threshold):
+
+    # Print each stage against the baseline. Returns the regressed stages -
+    # those slower, or using more memory, by more than threshold percent.
+
+    regressions = []
+    print('\nCompared with baseline:')
+    for run, stages in results.items():
+        for stage, result in stages.items():
+            old = baseline.get(run, {}).get(stage)
+            if old is None:
+                print(run + ' ' + format_result(stage, result, '   (new)'))
+                continue
+
+            change = ''
+            regressed = False
+            for field, label in (('seconds', 'time'), ('peakRssMb', 'memory')):
+                if result[field] is None or not old.get(field):
+                    continue
+                percent = (result[field] - old[field]) * 100.0 / old[field]
+                change += '   ' + label + ' ' + format(percent, '+.1f') + '%'
+                if percent > threshold:
+                    regressed = True
+            if regressed:
+                change += '   REGRESSION'
+                regressions.append(run + ' ' + stage)
+            print(run + ' ' + format_result(stage, result, change))
+    return regressions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark UniTrunker_XML2CSV on synthetic Unitrunker XML.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generateCommand = commands.add_parser('generate', help='write a synthetic Unitrunker.xml')
+    generateCommand.add_argument('xmlFile')
+    generateCommand.add_argument('--systems', type=int, default=1)
+    generateCommand.add_argument('--groups', type=int, default=2000, help='Groups per System')
+    generateCommand.add_argument('--users', type=int, default=100000, help='Users per System')
+    generateCommand.add_argument('--seed', type=int, default=1)
+
+    runCommand = commands.add_parser('run', help='time the converter')
+    runCommand.add_argument('xmlFile', nargs='?',
+                            help='XML file to time (default: generate one for each --users size)')
+    runCommand.add_argument('--users', default='10000,100000,1000000',
+                            help='comma separated Users counts to generate (default: 10000,100000,1000000)')
+    runCommand.add_argument('--systems', type=int, default=1)
+    runCommand.add_argument('--groups', type=int, default=2000)
+    runCommand.add_argument('--stages', default=None,
+                            help='comma separated stages (default: parse, filter, filter:columnar when NumPy is'
+                                 ' installed, every writer, convert and convert:pipeline)')
+    runCommand.add_argument('--repeat', type=int, default=1, help='runs per stage, the best is kept')
+    runCommand.add_argument('--save-baseline', metavar='JSON', help='save the results as a baseline')
+    runCommand.add_argument('--baseline', metavar='JSON', help='compare against a saved baseline')
+    runCommand.add_argument('--threshold', type=float, default=10.0,
+                            help='percent slower or larger that counts as a regression (default: 10)')
+
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        generate(args.xmlFile, args.systems, args.groups, args.users, args.seed)
+        print('Wrote ' + args.xmlFile)
+        return 0
+
+    if args.stages:
+        stages = args.stages.split(',')
+    else:
+        stages = (['parse', 'filter'] + (['filter:columnar'] if columnar.available() else [])
+                  + ['write:' + key for key, sink in outputSinks.items() if not sink.mergesInPlace]
+                  + ['convert', 'convert:pipeline'])
+
+    results = {}
+    generated = []
+    try:
+        if args.xmlFile:
+            runs = [(os.path.basename(args.xmlFile), args.xmlFile)]
+        else:
+            runs = []
+            for users in args.users.split(','):
+                handle, xmlFile = tempfile.mkstemp(prefix='bench_' + users + '_', suffix='.xml')
+                os.close(handle)
+                print('Generating ' + users + ' users...')
+                generate(xmlFile, args.systems, args.groups, int(users))
+                generated.append(xmlFile)
+                runs.append(('users=' + users, xmlFile))
+
+        for run, xmlFile in runs:
+            print('\n' + run + ' (' + format(os.path.getsize(xmlFile) / 1048576.0, '.1f') + ' MB)')
+            results[run] = benchmark(xmlFile, stages, args.repeat)
+    finally:
+        for xmlFile in generated:
+            os.remove(xmlFile)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baselineFile:
+            json.dump(results, baselineFile, indent=2)
+        print('\nSaved baseline ' + args.save_baseline)
+
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            regressions = compare(results, json.load(baselineFile), args.threshold)
+        if regressions:
+            print('\n' + str(len(regressions)) + ' regression(s): ' + ', '.join(regressions))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+# UniTrunker XML2CSV as a library.
+#
+#   from unitrunker_xml2csv import iter_users, prepare_radio
+#   for user in iter_users('Unitrunker.xml'):
+#       radio, exported = prepare_radio(user, 'no')
+#
+# The readers are generators so a large XML file is never held in memory.
+# Names are looked up in their modules on first use, so importing the
+# package itself loads nothing else.
+
+__version__ = '1.07'
+
+_exports = {
+    'Record': 'records',
+    'iter_records': 'records',
+    'iter_groups': 'records',
+    'iter_users': 'records',
+    'iter_channels': 'records',
+    'formatFrequency': 'records',
+    'load_records': 'cache',
+    'load_rules': 'rules',
+    'include_rid': 'rules',
+    'check_label': 'rules',
+    'prepare_group': 'rules',
+    'prepare_radio': 'rules',
+    'OutputSink': 'sinks',
+    'register_sink': 'sinks',
+    'create_sinks': 'sinks',
+    'export_records': 'export',
+    'convert': 'export',
+    'convert_batch': 'batch',
+    'diff_files': 'diff',
+    'Stats': 'stats',
+    'main': 'cli',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError('module ' + repr(__name__) + ' has no attribute ' + repr(name))
+    from importlib import import_module
+    value = getattr(import_module('.' + _exports[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,5 @@
+# python -m unitrunker_xml2csv
+
+from .cli import main
+
+main()
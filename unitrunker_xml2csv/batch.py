@@ -0,0 +1,109 @@
+# Batch conversion of many XML files, or of the Systems in them, in
+# parallel worker processes.
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import os
+
+from .compression import detect_compression, uncompressed_name
+from .export import convert
+from .partition import system_jobs
+from .stats import Stats
+
+
+def convert_worker(job):
+    # Process pool entry point for convert_batch()
+    name, source, settings, prefix, collectStats = job
+    stats = Stats() if collectStats else None
+    counts = convert(source, settings, prefix, stats=stats)
+    return name, counts, stats.report() if stats else None
+
+
+def job_size(job):
+    # Bytes of XML a job has to read
+    source = job[1]
+    if isinstance(source, str):
+        return os.path.getsize(source) if os.path.exists(source) else 0
+    return source.end - source.start
+
+
+def batch_prefixes(xmlFiles):
+
+    # Name each input's outputs after the XML file. Where two inputs share a
+    # file name (siteA/Unitrunker.xml, siteB/Unitrunker.xml) the folder name
+    # is added as well.
+
+    stems = [os.path.splitext(os.path.basename(uncompressed_name(xmlFile)))[0] for xmlFile in xmlFiles]
+    prefixes = []
+    for xmlFile, stem in zip(xmlFiles, stems):
+        if stems.count(stem) > 1:
+            folder = os.path.basename(os.path.dirname(os.path.abspath(xmlFile)))
+            stem = folder + '_' + stem
+        prefixes.append(stem + '_')
+    return prefixes
+
+
+def convert_batch(xmlFiles, settings, workers=None, collectStats=False):
+
+    # Convert many Unitrunker XML files, one per worker process, then print
+    # the record counts for each file and the totals. With partitionSystems
+    # each System in the files is converted in a worker of its own.
+    # Returns the totals and, with collectStats, a stats report per file
+    # (or System).
+
+    prefixes = batch_prefixes(xmlFiles) if len(xmlFiles) > 1 else ['']
+    jobs = []
+    for xmlFile, prefix in zip(xmlFiles, prefixes):
+        if settings['partitionSystems'] == 'yes' and detect_compression(xmlFile) is None:
+            jobs.extend(system_jobs(xmlFile, settings, prefix))
+        else:
+            if settings['partitionSystems'] == 'yes':
+                # Finding the Systems needs to seek around the raw file
+                print(xmlFile + " is compressed - converting it whole rather than by System")
+            jobs.append((xmlFile, xmlFile, settings, prefix))
+    names = [job[0] for job in jobs]
+
+    # Start the biggest first so the smaller ones fill in around it
+    jobs.sort(key=job_size, reverse=True)
+
+    results = {}
+    reports = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(convert_worker, job + (collectStats,)) for job in jobs]
+        for future in as_completed(futures):
+            try:
+                name, counts, report = future.result()
+                results[name] = counts
+                if report is not None:
+                    reports[name] = report
+            except Exception as error:
+                print("Conversion failed: " + str(error))
+
+    totals = {}
+    print("\nConverted " + str(len(results)) + " of " + str(len(names))
+          + (" systems" if settings['partitionSystems'] == 'yes' else " files"))
+    for name in names:
+        if name not in results:
+            print("  " + name + ": failed")
+            continue
+        counts = results[name]
+        print("  " + name + ": " + str(counts['talkgroups']) + " talkgroups, "
+              + str(counts['records']) + " radio ID records")
+        for key, value in counts.items():
+            totals[key] = totals.get(key, 0) + value
+    print("Total: " + str(totals.get('talkgroups', 0)) + " talkgroups, "
+          + str(totals.get('records', 0)) + " radio ID records")
+
+    return totals, reports
+
+
+def expand_inputs(patterns):
+    # Expand any wildcards ourselves as the Windows shell doesn't
+    xmlFiles = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            xmlFiles.extend(sorted(glob.glob(pattern)))
+        else:
+            xmlFiles.append(pattern)
+    return xmlFiles
@@ -0,0 +1,144 @@
+# Parsed record cache.
+#
+# Re-exporting the same XML with different settings parses it again every
+# time. With recordCache on, the records of the first parse are also saved
+# next to the XML (Unitrunker.xml.cache) in a compact binary form, and later
+# runs read them from there instead, which takes a fraction of the time.
+#
+# The cache is keyed on the XML's full path, modified time and size and on
+# cacheSchema, so a changed XML, or a new version of the Record, rebuilds
+# it on the next run. The file is memory mapped and holds a header and then
+# chunks of records, each a length and a marshal of the chunk's columns:
+#
+#   magic  length header  length chunk  length chunk ...  0
+#
+# The cache holds the records as read from the XML, before any labels or
+# rules are applied, so it serves every setting and command alike.
+
+import marshal
+import mmap
+import os
+import struct
+
+from .records import Record, iter_records
+
+
+cacheSchema = 2  # Bump when what iter_records() yields changes
+cacheMagic = b'UTXC'
+cacheChunk = 10000  # Records per chunk
+chunkLength = struct.Struct('<I')
+
+
+def cache_name(xmlSourceFile):
+    return xmlSourceFile + '.cache'
+
+
+def cache_key(xmlSourceFile):
+    # What the cache must match, or None if the XML can't be read
+    try:
+        stat = os.stat(xmlSourceFile)
+    except OSError:
+        return None
+    return {'schema': cacheSchema, 'fields': list(Record._fields), 'path': os.path.abspath(xmlSourceFile),
+            'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def open_cache(cacheFile, key):
+
+    # The cache memory mapped and the offset of its first chunk, or None if
+    # there is no cache, it is for another version of the XML or it is
+    # incomplete
+
+    try:
+        with open(cacheFile, 'rb') as cache:
+            data = mmap.mmap(cache.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None  # Missing, or empty
+    try:
+        offset = len(cacheMagic) + chunkLength.size
+        if data[:len(cacheMagic)] != cacheMagic or data[-chunkLength.size:] != chunkLength.pack(0):
+            raise ValueError('not a complete cache')
+        length, = chunkLength.unpack_from(data, len(cacheMagic))
+        if marshal.loads(data[offset:offset + length]) != key:
+            raise ValueError('cache is out of date')
+    except (ValueError, EOFError, TypeError, struct.error):
+        data.close()
+        return None
+    return data, offset + length
+
+
+def read_cache(data, offset):
+    # The records from an open cache
+    try:
+        make = Record._make
+        while True:
+            length, = chunkLength.unpack_from(data, offset)
+            if not length:
+                return
+            offset = offset + chunkLength.size
+            columns = marshal.loads(data[offset:offset + length])
+            offset = offset + length
+            yield from map(make, zip(*columns))
+    finally:
+        data.close()
+
+
+def write_cache(records, cacheFile, key):
+
+    # Pass records through, saving them to cacheFile as they go. The cache
+    # is written to a temporary file and only renamed into place once every
+    # record is in it and the XML hasn't changed in the meantime.
+
+    tmpName = cacheFile + '.tmp'
+    try:
+        cache = open(tmpName, 'wb')
+    except OSError as error:
+        print("Can't write the record cache: " + str(error))
+        yield from records
+        return
+
+    def write_chunk(cache, value):
+        blob = marshal.dumps(value)
+        cache.write(chunkLength.pack(len(blob)))
+        cache.write(blob)
+
+    done = False
+    try:
+        with cache:
+            cache.write(cacheMagic)
+            write_chunk(cache, key)
+            chunk = []
+            for record in records:
+                chunk.append(record)
+                if len(chunk) >= cacheChunk:
+                    write_chunk(cache, tuple(zip(*chunk)))
+                    chunk = []
+                yield record
+            if chunk:
+                write_chunk(cache, tuple(zip(*chunk)))
+            cache.write(chunkLength.pack(0))
+        done = cache_key(key['path']) == key
+        if done:
+            os.replace(tmpName, cacheFile)
+    finally:
+        if not done and os.path.exists(tmpName):
+            os.remove(tmpName)
+
+
+def load_records(xmlSourceFile, settings):
+
+    # iter_records() for xmlSourceFile, from its cache when the cache is up
+    # to date and recordCache is on. Otherwise the XML is parsed, and the
+    # cache saved for next time. Anything other than a file name (a System
+    # slice, an open file) is always parsed.
+
+    if settings['recordCache'] != 'yes' or not isinstance(xmlSourceFile, str):
+        return iter_records(xmlSourceFile, settings['streamXml'])
+    key = cache_key(xmlSourceFile)
+    if key is None:
+        return iter_records(xmlSourceFile, settings['streamXml'])  # Let it report the missing file
+    cacheFile = cache_name(xmlSourceFile)
+    cache = open_cache(cacheFile, key)
+    if cache is not None:
+        return read_cache(*cache)
+    return write_cache(iter_records(xmlSourceFile, settings['streamXml']), cacheFile, key)
@@ -0,0 +1,347 @@
+# Command line interface.
+#
+# Only argparse and the settings are loaded up front. The output sinks and
+# converter modules are imported once the arguments have been parsed, so
+# --help stays quick.
+
+import argparse
+import os
+import sys
+
+from .settings import settings as defaultSettings
+
+
+def main(argv=None):
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'diff':
+        return diff_main(argv[1:])
+    if argv and argv[0] == 'serve':
+        return serve_main(argv[1:])
+    if argv and argv[0] == 'enrich':
+        return enrich_main(argv[1:])
+    if argv and argv[0] == 'merge':
+        return merge_main(argv[1:])
+
+    settings = dict(defaultSettings)
+
+    parser = argparse.ArgumentParser(description='Extract the TalkGroups and Radio IDs from Unitrunker XML files.',
+                                     epilog="Run '%(prog)s diff OLD NEW' to compare two snapshots of the XML,"
+                                            " '%(prog)s merge XML XML...' to merge the XML of several sites,"
+                                            " '%(prog)s serve' to answer label lookups or '%(prog)s enrich LOG'"
+                                            " to add the labels to a decoder log.")
+    parser.add_argument('xmlFiles', nargs='*', metavar='XML',
+                        help='Unitrunker XML files or wildcard patterns (default: ' + settings['xmlSourceFile'] + ')')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes for a batch of files (default: one per CPU)')
+    parser.add_argument('--by-system', action='store_true',
+                        help='export each System in the XML to its own files, in parallel')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and re-export whenever the XML file changes')
+    parser.add_argument('--interval', type=float, default=2.0,
+                        help='seconds between checks when polling in watch mode (default: 2)')
+    parser.add_argument('--settle', type=float, default=5.0,
+                        help='seconds the XML must be unchanged before exporting in watch mode (default: 5)')
+    parser.add_argument('--output', action='append', metavar='NAME',
+                        help='write only this output, repeat for more (default: ' + ','.join(settings['outputs']) + ')')
+    parser.add_argument('--no-output', action='append', metavar='NAME', default=[],
+                        help="don't write this output, repeat for more")
+    parser.add_argument('--sort', choices=['id', 'hits', 'last'],
+                        help='sort the outputs by ID, by hits or by last heard')
+    parser.add_argument('--sort-buffer', type=int, metavar='N',
+                        help='records sorted in memory before spilling to disk (default: '
+                             + str(settings['sortBufferRecords']) + ')')
+    parser.add_argument('--compress', choices=['gzip', 'bz2', 'xz'],
+                        help='write the outputs compressed')
+    parser.add_argument('--playlist', metavar='PATH',
+                        help='merge the aliases into this SDRTrunk playlist.xml')
+    parser.add_argument('--dsd-groups', metavar='PATH',
+                        help='merge the group aliases into this DSD+.groups file')
+    parser.add_argument('--dsd-radios', metavar='PATH',
+                        help='merge the radio aliases into this DSD+.radios file')
+    parser.add_argument('--recent-days', type=int, metavar='N',
+                        help='only export Radio IDs heard in the last N days')
+    parser.add_argument('--top', type=int, metavar='K',
+                        help='only export the K Radio IDs with the most hits')
+    parser.add_argument('--sqlite', metavar='PATH',
+                        help='upsert the records into this SQLite database')
+    parser.add_argument('--columnar', action='store_true',
+                        help='filter the Radio IDs in NumPy batches, for very large files')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the parsed records in a cache file next to the XML')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='parse the XML and write each output in threads of their own')
+    parser.add_argument('--stats', metavar='JSON',
+                        help='write timings and counters for the run to this JSON file')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='write a cProfile dump of the run to this file')
+    parser.add_argument('--list-outputs', action='store_true',
+                        help='list the available outputs and exit')
+    args = parser.parse_args(argv)
+
+    from .sinks import outputSinks
+
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.list_outputs:
+        width = max(len(key) for key in outputSinks) + 2
+        for key, sinkClass in outputSinks.items():
+            print(key.ljust(width) + sinkClass.description)
+        return
+
+    outputs = args.output or settings['outputs']
+    for key in outputs + args.no_output:
+        if key not in outputSinks:
+            parser.error('unknown output ' + key + ' - choose from ' + ', '.join(outputSinks))
+    if args.playlist:
+        settings['sdrPlaylist'] = args.playlist
+        outputs = outputs + ['playlist']
+    if args.dsd_groups:
+        settings['dsdGroupsFile'] = args.dsd_groups
+        outputs = outputs + ['dsdgroupsmerge']
+    if args.dsd_radios:
+        settings['dsdRadiosFile'] = args.dsd_radios
+        outputs = outputs + ['dsdradiosmerge']
+    if args.sqlite:
+        settings['sqliteFile'] = args.sqlite
+        outputs = outputs + ['sqlite']
+    settings['outputs'] = [key for key in outputs if key not in args.no_output]
+    if args.sort:
+        settings['sortOutputs'] = args.sort
+    if args.sort_buffer is not None:
+        if args.sort_buffer < 1:
+            parser.error('--sort-buffer must be at least 1')
+        settings['sortBufferRecords'] = args.sort_buffer
+    if args.cache:
+        settings['recordCache'] = 'yes'
+    if args.pipeline:
+        settings['pipeline'] = 'yes'
+    if args.compress:
+        settings['compressOutputs'] = args.compress
+    if args.columnar:
+        settings['columnarFilter'] = 'yes'
+    if args.recent_days is not None:
+        if args.recent_days < 0:
+            parser.error('--recent-days must be at least 0')
+        settings['recentDays'] = args.recent_days
+    if args.top is not None:
+        if args.top < 1:
+            parser.error('--top must be at least 1')
+        settings['topRadios'] = args.top
+    if args.by_system:
+        settings['partitionSystems'] = 'yes'
+
+    from .batch import convert_batch, expand_inputs
+    from .export import convert
+    from .stats import Stats
+
+    xmlFiles = expand_inputs(args.xmlFiles)
+
+    if not args.xmlFiles:
+        xmlFiles = [settings['xmlSourceFile']]
+    elif not xmlFiles:
+        parser.error('no XML files match ' + ' '.join(args.xmlFiles))
+
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    if args.watch:
+        if len(xmlFiles) != 1:
+            parser.error('--watch takes a single XML file')
+        if settings['partitionSystems'] == 'yes':
+            parser.error("--watch can't export by System")
+        from .watch import watch
+        watch(xmlFiles[0], settings, args.interval, args.settle)
+    elif len(xmlFiles) == 1 and settings['partitionSystems'] != 'yes':
+        stats = Stats() if args.stats else None
+        counts = convert(xmlFiles[0], settings, stats=stats)
+        print("\nWrote " + str(counts['records']) + " records")
+        if stats is not None:
+            write_stats(args.stats, {xmlFiles[0]: stats.report()})
+    else:
+        if any(outputSinks[key].mergesInPlace for key in settings['outputs']):
+            parser.error("outputs that merge into an existing file can't be used with a batch of XML files"
+                         " or by System")
+        totals, reports = convert_batch(xmlFiles, settings, args.workers, bool(args.stats))
+        if args.stats:
+            write_stats(args.stats, reports)
+
+    if args.profile:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print("Wrote profile " + args.profile)
+
+
+def diff_main(argv):
+
+    settings = dict(defaultSettings)
+
+    parser = argparse.ArgumentParser(prog='unitrunker-xml2csv diff',
+                                     description='Report the TalkGroups and Radio IDs added, removed and changed'
+                                                 ' between two snapshots of a Unitrunker XML file.')
+    parser.add_argument('oldXmlFile', metavar='OLD', help='the earlier Unitrunker XML file')
+    parser.add_argument('newXmlFile', metavar='NEW', help='the later Unitrunker XML file')
+    parser.add_argument('--report', metavar='PREFIX',
+                        help='write the report to PREFIX.csv and PREFIX.json (default: diff_<date>)')
+    parser.add_argument('--hits-jump', type=int, default=settings['diffHitsJump'], metavar='N',
+                        help='report a change in hits of N or more (default: ' + str(settings['diffHitsJump']) + ')')
+    parser.add_argument('--buffer', type=int, default=settings['sortBufferRecords'], metavar='N',
+                        help='records sorted in memory before spilling to disk (default: '
+                             + str(settings['sortBufferRecords']) + ')')
+    args = parser.parse_args(argv)
+
+    if args.buffer < 1:
+        parser.error('--buffer must be at least 1')
+    settings['diffHitsJump'] = args.hits_jump
+    settings['sortBufferRecords'] = args.buffer
+
+    from datetime import datetime
+    from .diff import diff_files
+
+    reportPrefix = args.report or 'diff_' + datetime.today().strftime('%Y%m%d')
+    counts = diff_files(args.oldXmlFile, args.newXmlFile, reportPrefix, settings)
+    for kind, name in (('Group', 'TalkGroups'), ('User', 'Radio IDs')):
+        print(name + ": " + ", ".join(str(count) + " " + change for change, count in counts[kind].items()))
+    print("Wrote " + reportPrefix + ".csv and " + reportPrefix + ".json")
+
+
+def merge_main(argv):
+
+    settings = dict(defaultSettings)
+
+    parser = argparse.ArgumentParser(prog='unitrunker-xml2csv merge',
+                                     description='Merge the Unitrunker XML files of several sites into one export,'
+                                                 ' adding up the hits of IDs heard at more than one site.')
+    parser.add_argument('xmlFiles', nargs='+', metavar='XML',
+                        help='Unitrunker XML files or wildcard patterns, highest priority first')
+    parser.add_argument('--policy', choices=['recent', 'hits', 'priority'], default=settings['mergePolicy'],
+                        help='which site wins when labels differ (default: ' + settings['mergePolicy'] + ')')
+    parser.add_argument('--prefix', default='merged_',
+                        help='put on the front of the output file names (default: merged_)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes parsing the sites (default: one per CPU)')
+    parser.add_argument('--output', action='append', metavar='NAME',
+                        help='write only this output, repeat for more (default: ' + ','.join(settings['outputs']) + ')')
+    args = parser.parse_args(argv)
+
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    from .sinks import outputSinks
+    for key in args.output or []:
+        if key not in outputSinks:
+            parser.error('unknown output ' + key + ' - choose from ' + ', '.join(outputSinks))
+    if args.output:
+        settings['outputs'] = args.output
+
+    from .batch import expand_inputs
+    from .sitemerge import merge_sites
+
+    xmlFiles = expand_inputs(args.xmlFiles)
+    if not xmlFiles:
+        parser.error('no XML files match ' + ' '.join(args.xmlFiles))
+    merge_sites(xmlFiles, settings, args.policy, args.workers, args.prefix)
+
+
+def serve_main(argv):
+
+    settings = dict(defaultSettings)
+
+    parser = argparse.ArgumentParser(prog='unitrunker-xml2csv serve',
+                                     description='Answer TalkGroup and Radio ID label lookups over HTTP, reloading'
+                                                 ' when the Unitrunker XML changes.')
+    parser.add_argument('xmlFile', nargs='?', default=settings['xmlSourceFile'], metavar='XML',
+                        help='Unitrunker XML file (default: ' + settings['xmlSourceFile'] + ')')
+    parser.add_argument('--host', default=settings['lookupHost'],
+                        help='address to listen on (default: ' + settings['lookupHost'] + ')')
+    parser.add_argument('--port', type=int, default=settings['lookupPort'],
+                        help='port to listen on (default: ' + str(settings['lookupPort']) + ')')
+    parser.add_argument('--socket', default=settings['lookupSocket'], metavar='PATH',
+                        help='listen on this Unix socket instead')
+    parser.add_argument('--interval', type=float, default=2.0,
+                        help='seconds between checks of the XML when polling (default: 2)')
+    parser.add_argument('--settle', type=float, default=5.0,
+                        help='seconds the XML must be unchanged before reloading (default: 5)')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.xmlFile):
+        parser.error(args.xmlFile + ' not found')
+
+    from .lookup import is_socket, serve
+    if args.socket and os.path.exists(args.socket) and not is_socket(args.socket):
+        parser.error(args.socket + ' is already there and is not a socket - not replacing it')
+    serve(args.xmlFile, settings, args.host, args.port, args.socket, args.interval, args.settle)
+
+
+def enrich_main(argv):
+
+    settings = dict(defaultSettings)
+
+    parser = argparse.ArgumentParser(prog='unitrunker-xml2csv enrich',
+                                     description='Add the Unitrunker TalkGroup names and Radio ID callsigns to DSD+'
+                                                 ' or SDRTrunk logs.')
+    parser.add_argument('logFiles', nargs='*', default=['-'], metavar='LOG',
+                        help='logs to enrich, - for the standard input (default)')
+    parser.add_argument('--xml', default=settings['xmlSourceFile'],
+                        help='Unitrunker XML file (default: ' + settings['xmlSourceFile'] + ')')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write the enriched log here (default: the standard output)')
+    parser.add_argument('--csv', action='store_true',
+                        help='the logs are CSV with a header row, like SDRTrunk call events')
+    parser.add_argument('--tg-pattern', default=settings['logTgPattern'], metavar='REGEX',
+                        help='finds the TalkGroup in a text log (default: ' + settings['logTgPattern'] + ')')
+    parser.add_argument('--rid-pattern', default=settings['logRidPattern'], metavar='REGEX',
+                        help='finds the Radio ID in a text log (default: ' + settings['logRidPattern'] + ')')
+    parser.add_argument('--tg-column', default=settings['logTgColumn'], metavar='NAME',
+                        help='TalkGroup column of a CSV log (default: ' + settings['logTgColumn'] + ')')
+    parser.add_argument('--rid-column', default=settings['logRidColumn'], metavar='NAME',
+                        help='Radio ID column of a CSV log (default: ' + settings['logRidColumn'] + ')')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.xml):
+        parser.error(args.xml + ' not found')
+
+    import contextlib
+    from .enrich import enrich_csv, enrich_text, label_maps, open_log
+
+    # Any rule notes go to stderr as the log itself may be on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        groups, radios = label_maps(args.xml, settings)
+    outfile = open(args.output, 'w', newline='') if args.output else sys.stdout
+    lines = 0
+    labelled = 0
+    try:
+        for logFile in args.logFiles:
+            infile = open_log(logFile, sys.stdin)
+            try:
+                if args.csv:
+                    counts = enrich_csv(infile, outfile, groups, radios, args.tg_column, args.rid_column)
+                else:
+                    counts = enrich_text(infile, outfile, groups, radios, args.tg_pattern, args.rid_pattern)
+            finally:
+                if infile is not sys.stdin:
+                    infile.close()
+            lines += counts[0]
+            labelled += counts[1]
+    except ValueError as error:
+        parser.error(str(error))
+    finally:
+        if args.output:
+            outfile.close()
+
+    print("Enriched " + str(lines) + " lines, " + str(labelled) + " with a label", file=sys.stderr)
+
+
+def write_stats(statsFile, reports):
+    from datetime import datetime
+    import json
+
+    report = {
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'files': reports,
+    }
+    with open(statsFile, 'w') as outfile:
+        json.dump(report, outfile, indent=2)
+    print("Wrote stats " + statsFile)
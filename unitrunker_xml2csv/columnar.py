@@ -0,0 +1,182 @@
+# Columnar Radio ID filter.
+#
+# For very large User tables the row by row prepare_radio() spends most of
+# its time in per-row function calls. Here Users are taken a batch at a
+# time, their IDs collected into a NumPy array and the exclusion and
+# generic label ranges applied to the whole batch with searchsorted. The
+# last heard dates the Radio ID outputs need are cut out of the batch's
+# timestamps in one go as well and carried on the records (lastDate,
+# lastDsd), so the writers don't format them a row at a time. The
+# results are exactly those of prepare_radio(), in the same order.
+#
+# NumPy is optional - use available() to check before calling iter_prepared().
+
+from collections import namedtuple
+from functools import partial
+from itertools import compress, repeat
+from operator import is_not, itemgetter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .records import Record, get_last, get_last_dsd
+from .rules import default_rules, prepare_radio
+
+
+batchSize = 4096
+
+# A prepared User: the Record with its label upper cased and its last heard
+# date already in the formats of get_last() and get_last_dsd()
+PreparedUser = namedtuple('PreparedUser', Record._fields + ('lastDate', 'lastDsd'))
+
+noLabel = (None, False)
+newUser = partial(tuple.__new__, PreparedUser)
+
+
+def available():
+    return numpy is not None
+
+
+def range_arrays(index):
+    # A compiled interval index as NumPy arrays of starts and ends
+    starts, ends, infos = index
+    return numpy.array(starts, dtype=numpy.int64), numpy.array(ends, dtype=numpy.int64), infos
+
+
+def find_ranges(arrays, ids):
+
+    # The vectorised find_range(): for each ID the position of the range
+    # holding it, and a mask of the IDs that are in a range at all.
+
+    starts, ends, infos = arrays
+    if not len(starts):
+        return numpy.zeros(len(ids), dtype=numpy.intp), numpy.zeros(len(ids), dtype=bool)
+    positions = numpy.searchsorted(starts, ids, side='right') - 1
+    inRange = (positions >= 0) & (ids <= ends[numpy.maximum(positions, 0)])
+    return positions, inRange
+
+
+def batch_dates(lasts):
+
+    # get_last() and get_last_dsd() for a list of Unitrunker timestamps
+    # (last="20200917180302"). The characters of the timestamps are
+    # rearranged as NumPy columns; anything not 14 characters long is done
+    # by the functions themselves.
+
+    regular = [last is not None and len(last) == 14 for last in lasts]
+    stamps = numpy.array([last if ok else '0' * 14 for last, ok in zip(lasts, regular)], dtype='U14')
+    digits = stamps.view('U1').reshape(len(lasts), 14)
+
+    dates = numpy.empty((len(lasts), 10), dtype='U1')  # dd/mm/yyyy
+    dates[:, 0:2] = digits[:, 6:8]
+    dates[:, 3:5] = digits[:, 4:6]
+    dates[:, 6:10] = digits[:, 0:4]
+    dates[:, [2, 5]] = '/'
+
+    dsdDates = numpy.empty((len(lasts), 16), dtype='U1')  # yyyy/mm/dd hh:mm
+    dsdDates[:, 0:4] = digits[:, 0:4]
+    dsdDates[:, 5:7] = digits[:, 4:6]
+    dsdDates[:, 8:10] = digits[:, 6:8]
+    dsdDates[:, 11:13] = digits[:, 8:10]
+    dsdDates[:, 14:16] = digits[:, 10:12]
+    dsdDates[:, [4, 7]] = '/'
+    dsdDates[:, 10] = ' '
+    dsdDates[:, 13] = ':'
+
+    dates = dates.view('U10').ravel().tolist()
+    dsdDates = dsdDates.view('U16').ravel().tolist()
+    for row in [row for row, ok in enumerate(regular) if not ok]:
+        dates[row] = get_last(lasts[row])
+        dsdDates[row] = get_last_dsd(lasts[row])
+    return dates, dsdDates
+
+
+def prepare_users(users, createGenericRids, exclude, generic):
+
+    # prepare_radio() for a batch of User records at once.
+    # Returns a list of (record, exported) pairs, (None, False) for RIDs
+    # with no label, or None if an ID isn't a number that fits an int64 -
+    # the caller then takes the row by row path, which reports bad IDs.
+
+    ids = list(map(itemgetter(1), users))
+    labels = list(map(itemgetter(3), users))
+    labelled = numpy.fromiter(map(is_not, labels, repeat(None)), dtype=bool, count=len(users))
+
+    # prepare_radio() only looks at the ID of labelled Users, or of every
+    # User when it is making generic labels
+    if createGenericRids == 'yes':
+        parsed = numpy.ones(len(users), dtype=bool)
+    else:
+        parsed = labelled
+
+    try:
+        ridColumn = numpy.fromiter(map(int, compress(ids, parsed)), dtype=numpy.int64)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+    if createGenericRids == 'yes':
+        positions, inRange = find_ranges(generic, ridColumn)
+        needLabel = inRange & ~labelled
+        infos = generic[2]
+        for row, position in zip(numpy.flatnonzero(needLabel).tolist(), positions[needLabel].tolist()):
+            # Same as check_label()
+            rid = ids[row]
+            info = infos[position]
+            startDigit = len(rid) - int(info["labelDigits"])
+            labels[row] = info["label"] + "." + str(rid)[startDigit:7]
+
+    exported = numpy.ones(len(users), dtype=bool)
+    exported[parsed] = ~find_ranges(exclude, ridColumn)[1]
+
+    # Build the prepared records a column at a time: the labelled Users'
+    # fields, their labels upper cased and their dates added
+    keep = [label is not None for label in labels]
+    kept = list(compress(users, keep))
+    if not kept:
+        return [noLabel] * len(users)
+    columns = list(zip(*kept))
+    columns[3] = [label.upper() for label in compress(labels, keep)]
+    dates, dsdDates = batch_dates(columns[4])
+    pairs = zip(map(newUser, zip(*columns, dates, dsdDates)), compress(exported.tolist(), keep))
+    if len(kept) == len(users):
+        return list(pairs)
+    prepared = [noLabel] * len(users)
+    for row, pair in zip(compress(range(len(users)), keep), pairs):
+        prepared[row] = pair
+    return prepared
+
+
+def iter_prepared(records, createGenericRids, rules=None):
+
+    # Yield (record, prepared) for every record, where prepared is what
+    # prepare_radio() returns for a User and None for anything else.
+    # Users are gathered into batches, a batch ending early at any other
+    # record so the order of the XML is kept.
+
+    rules = rules or default_rules()
+    exclude = range_arrays(rules['exclude'])
+    generic = range_arrays(rules['generic'])
+
+    def prepare_batch(users):
+        prepared = prepare_users(users, createGenericRids, exclude, generic)
+        if prepared is None:
+            prepared = (prepare_radio(user, createGenericRids, rules) for user in users)
+        return zip(users, prepared)
+
+    users = []
+    for record in records:
+        if record.kind == 'User':
+            users.append(record)
+            if len(users) >= batchSize:
+                yield from prepare_batch(users)
+                users = []
+        else:
+            if users:
+                yield from prepare_batch(users)
+                users = []
+            yield record, None
+
+    if users:
+        yield from prepare_batch(users)
@@ -0,0 +1,91 @@
+# Compressed files.
+#
+# The Unitrunker XML can be gzip, bzip2 or xz compressed. It is recognised
+# by its first bytes, whatever the file is called, and decompressed as it
+# is parsed - nothing is unpacked to disk. The outputs can be written
+# compressed as well. The compression modules are only imported when a
+# compressed file turns up.
+
+from importlib import import_module
+import io
+import os
+
+
+# Compression name: (module, file name suffix, magic bytes)
+compressions = {
+    'gzip': ('gzip', '.gz', b'\x1f\x8b'),
+    'bz2': ('bz2', '.bz2', b'BZh'),
+    'xz': ('lzma', '.xz', b'\xfd7zXZ\x00'),
+}
+
+
+def detect_compression(fileName):
+    # The compression of a file from its first bytes, or None
+    with open(fileName, 'rb') as infile:
+        head = infile.read(6)
+    for name, (module, suffix, magic) in compressions.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def name_compression(fileName):
+    # The compression a file name's suffix says it has, or None
+    for name, (module, suffix, magic) in compressions.items():
+        if fileName.endswith(suffix):
+            return name
+    return None
+
+
+def uncompressed_name(fileName):
+    # Output.csv.gz -> Output.csv
+    compression = name_compression(fileName)
+    if compression is None:
+        return fileName
+    return fileName[:-len(compressions[compression][1])]
+
+
+def compressed_name(fileName, compression):
+    # Output.csv -> Output.csv.gz
+    if compression is None:
+        return fileName
+    return fileName + compressions[compression][1]
+
+
+def open_xml(source):
+
+    # Something ElementTree can parse for source. A compressed file is
+    # opened through its decompressor; anything else - an uncompressed
+    # file name or a file-like object - is handed back as it is.
+
+    if not isinstance(source, (str, os.PathLike)) or not os.path.isfile(source):
+        return source
+    compression = detect_compression(source)
+    if compression is None:
+        return source
+    return import_module(compressions[compression][0]).open(source, 'rb')
+
+
+def open_text(fileName, mode, compression=None, buffering=-1):
+
+    # Open a text file for reading ('r') or writing ('w') the way the
+    # outputs are, compressed with compression or plain if that is None.
+
+    if compression is None:
+        return open(fileName, mode, newline='', buffering=buffering)
+    module = import_module(compressions[compression][0])
+    if compression == 'gzip':
+        # No time stamp in the header, so the same output always
+        # compresses to the same bytes and unchanged files can be spotted
+        binary = module.GzipFile(fileName, mode + 'b', mtime=0)
+    else:
+        binary = module.open(fileName, mode + 'b')
+    return io.TextIOWrapper(binary, newline='')
+
+
+def is_empty(fileName):
+    # True if a (possibly compressed) output holds no text
+    if os.path.getsize(fileName) == 0:
+        return True
+    with open_text(fileName, 'r', name_compression(fileName)) as infile:
+        return not infile.read(1)
@@ -0,0 +1,130 @@
+# SQLite export.
+#
+# Keeps the Systems, TalkGroups and Radio IDs in one database that is
+# updated on every run rather than rewritten, so nothing is lost between
+# runs. Each run upserts its records in a single transaction and triggers
+# log every change in hits to the history table. Timestamps are stored as
+# 'YYYY-MM-DD HH:MM:SS' so SQLite's date functions work on them, e.g.
+#
+#   SELECT id, label, last FROM users WHERE last >= datetime('now', '-7 days');
+#   SELECT id, sum(delta) FROM history WHERE kind = 'User' AND run >= date('now', '-7 days') GROUP BY id;
+
+import sqlite3
+
+
+schema = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run TEXT PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS systems (
+    id TEXT PRIMARY KEY,
+    type TEXT,
+    label TEXT,
+    firstRun TEXT,
+    lastRun TEXT
+);
+
+CREATE TABLE IF NOT EXISTS groups (
+    system TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    brief TEXT,
+    label TEXT,
+    last TEXT,
+    notes TEXT,
+    hits INTEGER,
+    firstRun TEXT,
+    lastRun TEXT,
+    PRIMARY KEY (system, id)
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    system TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    brief TEXT,
+    label TEXT,
+    last TEXT,
+    notes TEXT,
+    hits INTEGER,
+    exported INTEGER,
+    firstRun TEXT,
+    lastRun TEXT,
+    PRIMARY KEY (system, id)
+);
+
+CREATE TABLE IF NOT EXISTS history (
+    run TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    system TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    hits INTEGER,
+    delta INTEGER,
+    last TEXT
+);
+
+CREATE INDEX IF NOT EXISTS groups_id ON groups (id);
+CREATE INDEX IF NOT EXISTS groups_last ON groups (last);
+CREATE INDEX IF NOT EXISTS groups_label ON groups (label);
+CREATE INDEX IF NOT EXISTS users_id ON users (id);
+CREATE INDEX IF NOT EXISTS users_last ON users (last);
+CREATE INDEX IF NOT EXISTS users_label ON users (label);
+CREATE INDEX IF NOT EXISTS history_id ON history (kind, id);
+CREATE INDEX IF NOT EXISTS history_run ON history (run);
+'''
+
+# New rows and changes in hits go in the history, with hits gained since
+# the previous run in delta
+historyTriggers = '''
+CREATE TRIGGER IF NOT EXISTS {table}_added AFTER INSERT ON {table}
+BEGIN
+    INSERT INTO history VALUES (new.lastRun, '{kind}', new.system, new.id, new.hits, new.hits, new.last);
+END;
+
+CREATE TRIGGER IF NOT EXISTS {table}_hits AFTER UPDATE OF hits ON {table}
+WHEN new.hits IS NOT old.hits
+BEGIN
+    INSERT INTO history VALUES (new.lastRun, '{kind}', new.system, new.id, new.hits,
+                                new.hits - coalesce(old.hits, 0), new.last);
+END;
+'''
+
+
+def iso_time(param):
+    # SQL turning a Unitrunker timestamp parameter (20200917180302) into
+    # 2020-09-17 18:03:02. Anything else is stored as it is.
+    return ("CASE WHEN length({0}) = 14 THEN substr({0}, 1, 4) || '-' || substr({0}, 5, 2) || '-' || substr({0}, 7, 2)"
+            " || ' ' || substr({0}, 9, 2) || ':' || substr({0}, 11, 2) || ':' || substr({0}, 13, 2)"
+            " ELSE {0} END").format(param)
+
+
+upsertSystem = '''
+INSERT INTO systems (id, type, label, firstRun, lastRun) VALUES (?1, ?2, ?3, ?4, ?4)
+ON CONFLICT (id) DO UPDATE SET type = excluded.type, label = excluded.label, lastRun = excluded.lastRun
+'''
+
+upsertGroup = '''
+INSERT INTO groups (system, id, brief, label, last, notes, hits, firstRun, lastRun)
+VALUES (?1, ?2, ?3, ?4, {last}, ?6, ?7, ?8, ?8)
+ON CONFLICT (system, id) DO UPDATE SET brief = excluded.brief, label = excluded.label, last = excluded.last,
+    notes = excluded.notes, hits = excluded.hits, lastRun = excluded.lastRun
+'''.format(last=iso_time('?5'))
+
+upsertUser = '''
+INSERT INTO users (system, id, brief, label, last, notes, hits, exported, firstRun, lastRun)
+VALUES (?1, ?2, ?3, ?4, {last}, ?6, ?7, ?8, ?9, ?9)
+ON CONFLICT (system, id) DO UPDATE SET brief = excluded.brief, label = excluded.label, last = excluded.last,
+    notes = excluded.notes, hits = excluded.hits, exported = excluded.exported, lastRun = excluded.lastRun
+'''.format(last=iso_time('?5'))
+
+
+def open_database(fileName, run):
+
+    # Open (or create) the database and start the transaction for a run.
+    # run is the time of the run, 'YYYY-MM-DD HH:MM:SS'.
+
+    connection = sqlite3.connect(fileName, isolation_level=None)
+    connection.executescript(schema + historyTriggers.format(table='groups', kind='Group')
+                             + historyTriggers.format(table='users', kind='User'))
+    connection.execute('BEGIN')
+    connection.execute('INSERT OR IGNORE INTO runs VALUES (?)', (run,))
+    return connection
@@ -0,0 +1,119 @@
+# Snapshot diff.
+#
+# Compares two Unitrunker XML files, e.g. yesterday's and today's archived
+# copies, and reports the TalkGroups and Radio IDs added, removed and
+# changed - a new label, brief or notes, or a jump in hits. Each file is
+# streamed into small per ID entries holding a hash of the fields the
+# export uses, which are put in ID order with an external sort and then
+# walked side by side. Memory is bounded by settings['sortBufferRecords']
+# however big the files are.
+
+import csv
+from datetime import datetime
+import hashlib
+import json
+
+from .cache import load_records
+from .extsort import external_sort
+from .records import clean, uCase
+
+
+reportHead = ['Change', 'Kind', 'System', 'ID', 'Fields', 'Old Label', 'New Label', 'Old Brief', 'New Brief',
+              'Old Notes', 'New Notes', 'Old Hits', 'New Hits', 'Hits Change']
+reportKeys = ['change', 'kind', 'system', 'id', 'fields', 'oldLabel', 'newLabel', 'oldBrief', 'newBrief',
+              'oldNotes', 'newNotes', 'oldHits', 'newHits', 'hitsChange']
+
+
+def diff_entries(xmlSourceFile, settings):
+
+    # One entry per TalkGroup and Radio ID:
+    # (kind, system, len(id), id, hash, hits, label, brief, notes)
+    # The fields are tidied the same way as for the export, and the length
+    # of the id ahead of it makes numeric ids sort as numbers.
+
+    for record in load_records(xmlSourceFile, settings):
+        if record.kind != 'Group' and record.kind != 'User':
+            continue
+        recordId = clean(record.id)
+        label = uCase(clean(record.label))
+        brief = clean(record.brief)
+        notes = clean(record.notes)
+        hits = int(record.hits) if record.hits and record.hits.isdigit() else 0
+        content = '\x1f'.join((label, brief, notes))
+        yield (record.kind, clean(record.system), len(recordId), recordId,
+               hashlib.blake2b(content.encode('utf-8'), digest_size=8).digest(), hits, label, brief, notes)
+
+
+def diff_snapshots(oldEntries, newEntries, hitsJump):
+
+    # Walk two sorted entry streams together and yield (change, old, new)
+    # for each ID added, removed or changed. Changed means the hash of the
+    # label, brief and notes differs or hits moved by hitsJump or more.
+
+    oldEntries = iter(oldEntries)
+    newEntries = iter(newEntries)
+    old = next(oldEntries, None)
+    new = next(newEntries, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[:4] < new[:4]):
+            yield 'removed', old, None
+            old = next(oldEntries, None)
+        elif old is None or new[:4] < old[:4]:
+            yield 'added', None, new
+            new = next(newEntries, None)
+        else:
+            if old[4] != new[4] or abs(new[5] - old[5]) >= hitsJump:
+                yield 'changed', old, new
+            old = next(oldEntries, None)
+            new = next(newEntries, None)
+
+
+def changed_fields(old, new, hitsJump):
+    fields = [name for name, position in (('label', 6), ('brief', 7), ('notes', 8)) if old[position] != new[position]]
+    if abs(new[5] - old[5]) >= hitsJump:
+        fields.append('hits')
+    return fields
+
+
+def report_row(change, old, new, hitsJump):
+    entry = old or new
+    fields = changed_fields(old, new, hitsJump) if change == 'changed' else []
+    row = [change, entry[0], entry[1], entry[3], ';'.join(fields)]
+    for position in (6, 7, 8, 5):
+        row.append(old[position] if old else '')
+        row.append(new[position] if new else '')
+    row.append(new[5] - old[5] if old and new else '')
+    return row
+
+
+def diff_files(oldXmlFile, newXmlFile, reportPrefix, settings):
+
+    # Write reportPrefix.csv and reportPrefix.json listing what changed from
+    # oldXmlFile to newXmlFile. Returns the counts by kind and change.
+
+    hitsJump = settings['diffHitsJump']
+    bufferSize = settings['sortBufferRecords']
+    oldEntries = external_sort(diff_entries(oldXmlFile, settings), bufferSize)
+    newEntries = external_sort(diff_entries(newXmlFile, settings), bufferSize)
+
+    counts = {kind: {'added': 0, 'removed': 0, 'changed': 0} for kind in ('Group', 'User')}
+
+    # The JSON is written a change at a time so it never has to be held
+    # in memory, with the counts at the end
+    with open(reportPrefix + '.csv', 'w', newline='') as csvFile, \
+            open(reportPrefix + '.json', 'w') as jsonFile:
+        writer = csv.writer(csvFile)
+        writer.writerow(reportHead)
+        jsonFile.write('{\n  "old": ' + json.dumps(oldXmlFile) + ',\n  "new": ' + json.dumps(newXmlFile)
+                       + ',\n  "generated": ' + json.dumps(datetime.now().isoformat(timespec='seconds'))
+                       + ',\n  "hitsJump": ' + json.dumps(hitsJump) + ',\n  "changes": [')
+        separator = '\n    '
+        for change, old, new in diff_snapshots(oldEntries, newEntries, hitsJump):
+            row = report_row(change, old, new, hitsJump)
+            writer.writerow(row)
+            jsonFile.write(separator + json.dumps(dict(zip(reportKeys, row))))
+            separator = ',\n    '
+            counts[row[1]][change] += 1
+        jsonFile.write('\n  ],\n  "counts": ' + json.dumps(counts) + '\n}\n')
+
+    return counts
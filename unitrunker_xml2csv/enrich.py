@@ -0,0 +1,141 @@
+# Log enrichment.
+#
+# Adds the Unitrunker TalkGroup names and Radio ID callsigns to decoder
+# call and event logs (DSD+, SDRTrunk) that only hold the raw numbers. The
+# labels are read from the XML once into two dictionaries, with the same
+# labels as the exports, and the logs are then streamed a line at a time,
+# so memory depends on the size of the XML and not of the logs.
+#
+# Text logs have the IDs found with a regular expression and the labels
+# added on the end of the line, tab separated. CSV logs (SDRTrunk call
+# events) get three new columns on the end of each row.
+
+import csv
+import os
+import re
+
+from .cache import load_records
+from .compression import name_compression, open_text
+from .records import clean
+from .rules import load_rules, prepare_group, prepare_radio
+
+
+enrichHead = ['TG Name', 'TG User', 'Callsign']
+linesPerWrite = 10000
+
+
+def label_maps(xmlSourceFile, settings):
+
+    # {TalkGroup id: (name, user)} and {Radio ID: callsign}, as the TalkGroup
+    # and Radio ID CSVs would have them. Encrypted and noise Radio IDs,
+    # which the exports leave out, keep their callsign here.
+
+    if os.path.exists(settings['ridRulesFile']):
+        rules = load_rules(settings['ridRulesFile'])
+    else:
+        rules = load_rules()
+
+    groups = {}
+    radios = {}
+    for record in load_records(xmlSourceFile, settings):
+        if record.kind == 'Group':
+            tg = prepare_group(record)
+            if tg is not None and tg.id not in groups:
+                groups[tg.id] = (clean(tg.label), clean(tg.brief))
+        elif record.kind == 'User':
+            radio, exported = prepare_radio(record, settings['createGenericRids'], rules)
+            if radio is not None and radio.id not in radios:
+                radios[radio.id] = radio.label
+    return groups, radios
+
+
+def find_label(labels, recordId):
+    # Logs sometimes pad IDs with zeros
+    label = labels.get(recordId)
+    if label is None and recordId[:1] == '0':
+        label = labels.get(recordId.lstrip('0') or '0')
+    return label
+
+
+def enrich_text(infile, outfile, groups, radios, tgPattern, ridPattern):
+
+    # Add the TalkGroup name, TalkGroup user and callsign to the end of each
+    # line of a text log. Returns (lines, lines with a label found).
+
+    # The loop is kept tight - it runs for every line of the log
+    tgSearch = re.compile(tgPattern).search
+    ridSearch = re.compile(ridPattern).search
+    getGroup = groups.get
+    getRadio = radios.get
+    noGroup = ('', '')
+    lines = 0
+    labelled = 0
+    pending = []
+    append = pending.append
+    for line in infile:
+        line = line.rstrip('\r\n')
+        group = callsign = None
+        found = tgSearch(line)
+        if found:
+            group = getGroup(found.group(1)) or find_label(groups, found.group(1))
+        found = ridSearch(line)
+        if found:
+            callsign = getRadio(found.group(1)) or find_label(radios, found.group(1))
+        if group is None and callsign is None:
+            append(line + '\t\t\t\n')
+        else:
+            labelled += 1
+            name, user = group or noGroup
+            append(line + '\t' + name + '\t' + user + '\t' + (callsign or '') + '\n')
+        if len(pending) >= linesPerWrite:
+            lines += len(pending)
+            outfile.write(''.join(pending))
+            pending.clear()
+    lines += len(pending)
+    outfile.write(''.join(pending))
+    return lines, labelled
+
+
+def enrich_csv(infile, outfile, groups, radios, tgColumn, ridColumn):
+
+    # Add TG Name, TG User and Callsign columns to a CSV log whose first row
+    # names its columns. Returns (rows, rows with a label found).
+
+    reader = csv.reader(infile)
+    writer = csv.writer(outfile)
+    header = next(reader, None)
+    if header is None:
+        return 0, 0
+    columns = [name.strip().upper() for name in header]
+    for column in (tgColumn, ridColumn):
+        if column.upper() not in columns:
+            raise ValueError('the log has no ' + column + ' column - its columns are ' + ', '.join(header))
+    tgIndex = columns.index(tgColumn.upper())
+    ridIndex = columns.index(ridColumn.upper())
+    writer.writerow(header + enrichHead)
+
+    noGroup = ('', '')
+    rows = 0
+    labelled = 0
+    pending = []
+    for row in reader:
+        group = find_label(groups, row[tgIndex].strip()) if len(row) > tgIndex else None
+        callsign = find_label(radios, row[ridIndex].strip()) if len(row) > ridIndex else None
+        if group is not None or callsign is not None:
+            labelled += 1
+        row.extend(group or noGroup)
+        row.append(callsign or '')
+        pending.append(row)
+        rows += 1
+        if len(pending) >= linesPerWrite:
+            writer.writerows(pending)
+            pending = []
+    writer.writerows(pending)
+    return rows, labelled
+
+
+def open_log(logFile, stdin):
+    # '-' is the standard input; a .gz, .bz2 or .xz log is decompressed
+    if logFile == '-':
+        return stdin
+    return open_text(logFile, 'r', name_compression(logFile))
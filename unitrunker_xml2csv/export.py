@@ -0,0 +1,405 @@
+# The export pipeline.
+#
+# Feeds records from the XML to the enabled output sinks, with the
+# incremental (delta) export built on top.
+
+from datetime import datetime
+import filecmp
+import hashlib
+from itertools import repeat
+import json
+import os
+
+from . import rules as ruleModule, sinks as sinkModule
+from .cache import load_records
+from .compression import is_empty, name_compression, open_text
+from .records import clean
+from .rules import load_rules, prepare_group, prepare_radio
+from .selection import radio_selection
+from .sinks import create_sinks, output_names
+
+
+def export_records(records, sinks, fileNames, createGenericRids, rules=None, snapshot=None, oldHashes=None, changes=None,
+                   stats=None, columnar=False, selection=None, pipeline=False):
+
+    # Feed every record to the enabled sinks.
+    # For a full export oldHashes is None and every record is written.
+    # For a delta export only records whose content hash differs from
+    # oldHashes are written, and their new output text is collected in
+    # changes for patching the previous full outputs.
+    # snapshot, when given, collects the state for the next delta run.
+    # stats, when given, collects timings and counters (see Stats).
+    # columnar prepares the Radio IDs in NumPy batches (see columnar.py).
+    # selection, when given, limits the exported Radio IDs to the recently
+    # heard and/or busiest (see selection.py) - other Radio IDs are dropped.
+    # pipeline parses the XML and runs each sink in threads of their own
+    # (see pipeline.py).
+
+    if pipeline:
+        from .pipeline import SinkThreads, threaded_records
+        records = parsed = threaded_records(records)
+
+    if columnar:
+        from . import columnar as columnarModule
+        records = columnarModule.iter_prepared(records, createGenericRids, rules)
+    else:
+        records = zip(records, repeat(None))
+
+    if stats is not None:
+        restores = [stats.instrument(globals(), ['prepare_group', 'prepare_radio']),
+                    stats.instrument(vars(ruleModule), ['include_rid', 'check_label', 'uCase']),
+                    stats.instrument(vars(sinkModule), ['get_last', 'get_last_dsd'])]
+        if columnar:
+            restores.append(stats.instrument(vars(columnarModule), ['prepare_users']))
+        for sink in sinks.values():
+            stats.instrument_sink(sink)
+
+    if pipeline:
+        # The sinks are opened and fed in their own threads
+        sinkList = [SinkThreads(sinks, fileNames)]
+    else:
+        for key, sink in sinks.items():
+            sink.open(fileNames[key])
+        sinkList = list(sinks.values())
+
+    # Counters
+
+    GroupCounter = 0
+    RowCounter = 0
+
+    try:
+        for record, prepared in records:
+            if record.kind == 'System':
+                for sink in sinkList:
+                    sink.system(record)
+                continue
+
+            if record.kind == 'Channel':  # Site frequencies, always written in full
+                for sink in sinkList:
+                    sink.channel(record)
+                continue
+
+            if snapshot is not None:
+                key = snapshot_record(snapshot, record)
+                if oldHashes is not None and oldHashes.get(key) == snapshot['hashes'][key]:
+                    continue  # Unchanged since the last run
+
+            if record.kind == 'Group':  # Find the TalkGroups records
+                tg = prepare_group(record)
+                if tg is not None:
+                    GroupCounter = GroupCounter + 1
+                    for sink in sinkList:
+                        sink.group(tg)
+
+                if stats is not None:
+                    stats.count('groupsSeen')
+                    if tg is not None:
+                        stats.count('groupsWritten')
+
+                if changes is not None:
+                    recordId = key.split('/', 1)[1]
+                    for sink in sinks.values():
+                        patchKey = sink.patch_key('Group', recordId)
+                        if patchKey is not None:
+                            changes[sink.key][patchKey] = sink.group_text(tg) if tg else None
+
+            elif record.kind == 'User':  # Find the Radio ID records
+                radio, exported = prepared or prepare_radio(record, createGenericRids, rules)
+
+                if stats is not None:
+                    stats.count_radio(record, radio, exported, rules)
+
+                if selection is not None and radio is not None:
+                    # Recently heard go straight out, the top K wait for the end
+                    radio = selection.add(radio) if exported and selection.recent(radio) else None
+
+                if radio is not None:
+                    if exported:
+                        RowCounter = RowCounter + 1
+                    for sink in sinkList:
+                        sink.radio(radio, exported)
+
+                if changes is not None:
+                    recordId = key.split('/', 1)[1]
+                    for sink in sinks.values():
+                        patchKey = sink.patch_key('User', recordId)
+                        if patchKey is not None:
+                            changes[sink.key][patchKey] = sink.radio_text(radio) if exported else None
+
+        if selection is not None:  # The top K by hits, if any
+            for radio in selection.selected():
+                RowCounter = RowCounter + 1
+                for sink in sinkList:
+                    sink.radio(radio, True)
+    except BaseException:
+        for sink in sinkList:
+            sink.abort()
+        raise
+    else:
+        for sink in sinkList:
+            sink.close()
+    finally:
+        if pipeline:
+            parsed.close()  # Stops the parsing thread if the export failed
+        if stats is not None:
+            for restore in restores:
+                restore()
+            for key in sinks:
+                if os.path.exists(fileNames[key]):
+                    stats.count('bytesWritten.' + key, os.path.getsize(fileNames[key]))
+
+    return {'talkgroups': GroupCounter, 'records': RowCounter}
+
+
+def digits(value):
+    return int(value) if value and value.isdigit() else 0
+
+
+# Sort keys for sortOutputs. Systems and Site Channels stay first, in the
+# order of the file, then the TalkGroups and then the Radio IDs, each
+# sorted by ID, by hits or by last heard (the busiest and most recent
+# first, ties by ID).
+kindRank = {'Group': 1, 'User': 2}
+recordSortKeys = {
+    'id': lambda record: (len(record.id or ''), record.id or ''),
+    'hits': lambda record: (-digits(record.hits), len(record.id or ''), record.id or ''),
+    'last': lambda record: (-digits(record.last), len(record.id or ''), record.id or ''),
+}
+
+
+def sort_records(records, sortBy, bufferSize):
+
+    # The records in sortBy order. Up to bufferSize records are sorted in
+    # memory; beyond that sorted runs are spilled to temporary files and
+    # merged back as the outputs are written (see extsort.py). Systems
+    # keep their order in the file.
+
+    from .extsort import external_sort
+    sortKey = recordSortKeys[sortBy]
+
+    def key(record):
+        if record.kind in kindRank:
+            return (kindRank[record.kind],) + sortKey(record)
+        return (0,)
+
+    return external_sort(records, bufferSize, key=key)
+
+
+def new_snapshot():
+    return {'last': '', 'hashes': {}, 'seen': {}}
+
+
+def snapshot_record(snapshot, record):
+
+    # Hash the fields main() exports and add the record to the snapshot.
+    # Returns the record key.
+
+    key = record.kind[0] + '/' + clean(record.id)
+    seen = snapshot['seen'].get(key, 0)
+    snapshot['seen'][key] = seen + 1
+    if seen:
+        key = key + '#' + str(seen)
+
+    last = clean(record.last)
+    if last > snapshot['last']:
+        snapshot['last'] = last
+
+    content = '\x1f'.join((clean(record.brief), clean(record.label), last,
+                           clean(record.notes), clean(record.hits)))
+    snapshot['hashes'][key] = hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+
+    return key
+
+
+def load_state(stateFile):
+    if not os.path.exists(stateFile):
+        return None
+    with open(stateFile, encoding='utf-8') as state:
+        return json.load(state)
+
+
+def save_state(stateFile, snapshot, outputNames):
+    state = {'last': snapshot['last'], 'outputs': outputNames, 'hashes': snapshot['hashes']}
+    with open(stateFile + '.tmp', 'w', encoding='utf-8') as tmp:
+        json.dump(state, tmp, separators=(',', ':'))
+    os.replace(stateFile + '.tmp', stateFile)
+
+
+def patch_output(fileName, chunks, changes, header=None):
+
+    # Rewrite a previous full output in place: changed records are replaced,
+    # removed records (change of None) dropped and new records appended.
+    # The rewrite goes to a temporary file which then replaces the original.
+
+    if not os.path.exists(fileName):
+        print("Can't patch " + fileName + " - file not found")
+        return
+
+    changes = dict(changes)
+    occurrences = {}
+    needHeader = header is not None
+
+    compression = name_compression(fileName)
+    with open_text(fileName, 'r', compression) as infile, open_text(fileName + '.tmp', 'w', compression) as outfile:
+        for key, text in chunks(infile):
+            if key is None:
+                needHeader = False
+                outfile.write(text)
+                continue
+
+            seen = occurrences.get(key, 0)
+            occurrences[key] = seen + 1
+            if seen:
+                key = key + '#' + str(seen)
+
+            if key in changes:
+                text = changes.pop(key)
+            if text is not None:
+                outfile.write(text)
+
+        for text in changes.values():
+            if text is not None:
+                if needHeader:
+                    outfile.write(header)
+                    needHeader = False
+                outfile.write(text)
+
+    os.replace(fileName + '.tmp', fileName)
+
+
+def export_delta(records, state, sinks, deltaNames, createGenericRids, rules=None, patchFullOutputs='no', stats=None,
+                 columnar=False, pipeline=False):
+
+    # Write only the records that are new or changed since the state was
+    # saved, optionally patching the previous full outputs to match.
+    # Sinks that are written in full (the Site frequencies) go straight to
+    # their full output in state['outputs'] rather than to a delta file.
+
+    snapshot = new_snapshot()
+    oldHashes = state['hashes']
+    fullNames = state['outputs']
+    changes = None
+    if patchFullOutputs == 'yes':
+        changes = {key: {} for key in sinks}
+
+    fileNames = {key: fullNames[key] if sinks[key].writtenInFull and key in fullNames else name
+                 for key, name in deltaNames.items()}
+    counts = export_records(records, sinks, fileNames, createGenericRids, rules, snapshot, oldHashes, changes, stats,
+                            columnar, pipeline=pipeline)
+
+    # Don't leave empty delta files behind when nothing changed
+    for key, fileName in deltaNames.items():
+        if fileNames[key] == fileName and not sinks[key].mergesInPlace and is_empty(fileName):
+            os.remove(fileName)
+
+    removed = [key for key in oldHashes if key not in snapshot['hashes']]
+    changed = sum(1 for key, value in snapshot['hashes'].items() if oldHashes.get(key) != value)
+
+    if changes is not None:
+        for key in removed:
+            kind, recordId = key.split('/', 1)
+            kind = 'Group' if kind == 'G' else 'User'
+            for sink in sinks.values():
+                patchKey = sink.patch_key(kind, recordId)
+                if patchKey is not None:
+                    changes[sink.key][patchKey] = None
+
+        for key, sink in sinks.items():
+            if key in fullNames and not sink.mergesInPlace and not sink.writtenInFull:
+                patch_output(fullNames[key], sink.chunks, changes[key], sink.patch_header())
+
+    print("\n" + str(changed) + " records new or changed, " + str(len(removed))
+          + " removed since " + (state['last'] or 'the last run'))
+
+    return snapshot, counts
+
+
+def convert(xmlSourceFile, settings, prefix='', atomic=False, stats=None):
+
+    # Convert one Unitrunker XML file. prefix is put on the front of every
+    # output file name so a batch of inputs don't overwrite each other.
+    # With atomic the full outputs are written to temporary files and only
+    # those whose content changed replace the originals.
+    # stats, when given, collects timings and counters for --stats.
+    # Returns a dictionary of record counts.
+
+    if os.path.exists(settings['ridRulesFile']):
+        rules = load_rules(settings['ridRulesFile'])
+    else:
+        rules = load_rules()
+
+    datestamp = datetime.today().strftime('%Y%m%d')
+    createGenericRids = settings['createGenericRids']
+    stateFile = prefix + settings['stateFile']
+
+    columnar = settings['columnarFilter'] == 'yes'
+    if columnar:
+        from .columnar import available
+        if not available():
+            print("NumPy isn't installed - filtering Radio IDs row by row")
+            columnar = False
+
+    pipeline = settings['pipeline'] == 'yes'
+
+    selection = radio_selection(settings)
+    if selection is not None and settings['incrementalExport'] == 'yes':
+        print("recentDays and topRadios can't be used with an incremental export - exporting every Radio ID")
+        selection = None
+
+    records = load_records(xmlSourceFile, settings)
+    if stats is not None:
+        records = stats.iter_timed('xmlParse', records)
+    if settings['sortOutputs'] != 'no':
+        records = sort_records(records, settings['sortOutputs'], settings['sortBufferRecords'])
+    sinks = create_sinks(settings)
+
+    state = None
+    if settings['incrementalExport'] == 'yes':
+        state = load_state(stateFile)
+
+    if state is not None:
+        deltaNames = output_names(datetime.today().strftime('%Y%m%d_%H%M%S'), prefix + 'delta_', sinks)
+        # Outputs written in full that the last full run didn't have
+        for key, name in output_names(datestamp, prefix, sinks).items():
+            if sinks[key].writtenInFull:
+                state['outputs'].setdefault(key, name)
+        snapshot, counts = export_delta(records, state, sinks, deltaNames, createGenericRids, rules,
+                                        settings['patchFullOutputs'], stats, columnar, pipeline)
+        save_state(stateFile, snapshot, state['outputs'])
+    else:
+        snapshot = new_snapshot() if settings['incrementalExport'] == 'yes' else None
+        outputNames = output_names(datestamp, prefix, sinks)
+        if atomic:
+            # Sinks that merge into an existing file do their own atomic rename
+            tmpNames = {key: name if sinks[key].mergesInPlace else name + '.tmp'
+                        for key, name in outputNames.items()}
+            try:
+                counts = export_records(records, sinks, tmpNames, createGenericRids, rules, snapshot, stats=stats,
+                                        columnar=columnar, selection=selection, pipeline=pipeline)
+            except Exception:
+                for key, tmpName in tmpNames.items():
+                    if not sinks[key].mergesInPlace and os.path.exists(tmpName):
+                        os.remove(tmpName)
+                raise
+            for key, name in outputNames.items():
+                if not sinks[key].mergesInPlace and replace_if_changed(tmpNames[key], name):
+                    print("Updated " + name)
+        else:
+            counts = export_records(records, sinks, outputNames, createGenericRids, rules, snapshot, stats=stats,
+                                    columnar=columnar, selection=selection, pipeline=pipeline)
+        if snapshot is not None:
+            save_state(stateFile, snapshot, outputNames)
+
+    return counts
+
+
+def replace_if_changed(tmpName, fileName):
+
+    # Move a freshly written output over the old one with an atomic rename,
+    # or throw it away if the content is the same. Returns True if replaced.
+
+    if os.path.exists(fileName) and filecmp.cmp(tmpName, fileName, shallow=False):
+        os.remove(tmpName)
+        return False
+    os.replace(tmpName, fileName)
+    return True
@@ -0,0 +1,68 @@
+# External merge sort.
+#
+# Sorts more items than will fit in memory. Items are gathered into runs of
+# bufferSize, each run is sorted and spilled to a temporary file, and the
+# runs are merged back together with heapq.merge. Memory holds one run
+# plus a chunk from each spilled run, however many items there are. An
+# input that fits in one run never touches the disk.
+
+import heapq
+from itertools import islice
+import pickle
+import tempfile
+
+
+chunkSize = 1024  # Items per pickle in a run file
+
+
+def dump_items(items, outfile):
+    # Write items to a binary file in chunks for read_run()
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunkSize:
+            pickle.dump(chunk, outfile, pickle.HIGHEST_PROTOCOL)
+            chunk = []
+    if chunk:
+        pickle.dump(chunk, outfile, pickle.HIGHEST_PROTOCOL)
+
+
+def write_run(items, tmpDir=None):
+    run = tempfile.TemporaryFile(dir=tmpDir)
+    dump_items(items, run)
+    run.seek(0)
+    return run
+
+
+def read_run(run):
+    while True:
+        try:
+            chunk = pickle.load(run)
+        except EOFError:
+            return
+        yield from chunk
+
+
+def external_sort(items, bufferSize, key=None, tmpDir=None):
+
+    # Yield items in sorted order, keeping at most bufferSize of them in
+    # memory. Items must be picklable. Equal items keep their input order.
+
+    runs = []
+    try:
+        items = iter(items)
+        while True:
+            buffer = list(islice(items, bufferSize))
+            buffer.sort(key=key)
+            if len(buffer) < bufferSize:
+                break  # The last run stays in memory
+            runs.append(write_run(buffer, tmpDir))
+            buffer = None
+
+        if not runs:
+            yield from buffer
+        else:
+            yield from heapq.merge(*[read_run(run) for run in runs], buffer, key=key)
+    finally:
+        for run in runs:
+            run.close()
@@ -0,0 +1,182 @@
+# Output text formats.
+#
+# Column headers and the line formats for the SDRTrunk playlist and DSD+
+# alias and frequency files.
+
+import csv
+import io
+import re
+
+from .records import clean
+
+
+rowTgHead = ['TGID', 'TG_User', 'TG_Name', 'Last Heard', 'Notes', 'Hits']
+
+# Ordered so that I can copy and paste the first four
+# columns into UBCD Sentinel
+rowRidHead = ['Callsign', 'RadioID', 'Alert Tone', 'Alert Light', 'Brief', 'Last Heard', 'Notes', 'Hits']
+
+rowFreqHead = ['System', 'Site', 'Site Name', 'Channel', 'Frequency MHz', 'Use']
+
+
+def csv_text(row):
+    text = io.StringIO()
+    csv.writer(text).writerow(row)
+    return text.getvalue()
+
+
+def sdrAliasName(alias):
+    # Tidy an alias name and escape it for use in an XML attribute.
+    # Same as xml.sax.saxutils.escape(alias, {'"': '&quot;'}), which would
+    # pull in urllib and slow down starting up.
+    alias = clean(alias)
+    alias = alias.strip()
+    return alias.replace('&', '&amp;').replace('>', '&gt;').replace('<', '&lt;').replace('"', '&quot;')
+
+
+def sdrTgAliasText(talkgroup, alias, listname='NSWGRN'):
+    protocol = 'APCO25'
+    color = '0'
+    idtype = 'talkgroup'
+    alias = sdrAliasName(alias)
+
+    talkgroup = clean(talkgroup)
+    talkgroup = str(talkgroup)
+
+    return ('  <alias name=\"' + alias
+            + '\" color=\"' + color
+            + '\" group=\"' + talkgroup
+            + '\" list=\"' + listname
+            + '\">\n    <id type=\"' + idtype
+            + '\" value=\"' + talkgroup
+            + '\" protocol=\"' + protocol
+            + '\"/>\n  </alias>\n')
+
+
+def writeSdrTgAliasRow(outfile, talkgroup, alias):
+    outfile.write(sdrTgAliasText(talkgroup, alias))
+
+
+def sdrRadioAliasText(radioId, alias, listname='NSWGRN'):
+    protocol = 'APCO25'
+    color = '0'
+    idtype = 'radio'
+    alias = sdrAliasName(alias)
+
+    radioId = clean(radioId)
+    radioId = str(radioId)
+
+    return ('  <alias name=\"' + alias
+            + '\" color=\"' + color
+            + '\" list=\"' + listname
+            + '\">\n    <id type=\"' + idtype
+            + '\" value=\"' + radioId
+            + '\" protocol=\"' + protocol
+            + '\"/>\n  </alias>\n')
+
+
+def writeSdrRadioAliasRow(outfile, radioId, alias):
+    outfile.write(sdrRadioAliasText(radioId, alias))
+
+
+def dsdAliasName(alias):
+    alias = clean(alias)
+    alias = alias.strip()
+    alias = re.sub('[&]', '.', alias)
+    return alias
+
+
+def dsdLine(dsdProtocol, dsdNetworkId, dsdId, dsdPriority, dsdOverride, dsdHits, dsdTimeStamp, alias, newline='\n'):
+
+    # line format: protocol, networkID, group or radio, priority, override, hits, timestamp, "alias"
+
+    return (dsdProtocol
+            + ',    ' + dsdNetworkId
+            + ',    ' + dsdId
+            + ',    ' + dsdPriority
+            + ',    ' + dsdOverride
+            + ',    ' + dsdHits
+            + ',    ' + dsdTimeStamp
+            + ',    \"' + alias + '\"' + newline)
+
+
+def dsdHitCount(hits):
+    # Unitrunker's hit count, or 0 when it has none
+    hits = clean(hits).strip()
+    return hits if hits.isdigit() else '0'
+
+
+def dsdTgAliasText(talkgroup, lastseen, user, alias, dsdNetworkId='BEE00.2D1', hits=None):
+
+    dsdProtocol = 'P25'
+    dsdPriority = '50'
+    dsdOverride = 'Normal'
+    dsdHits = dsdHitCount(hits)
+    dsdTimeStamp = str(lastseen)
+
+    alias = user + '.' + dsdAliasName(alias)
+    talkgroup = clean(talkgroup)
+    talkgroup = str(talkgroup)
+
+    return dsdLine(dsdProtocol, dsdNetworkId, talkgroup, dsdPriority, dsdOverride, dsdHits, dsdTimeStamp, alias)
+
+
+def dsdRadioAliasText(radioId, lastseen, alias, dsdNetworkId='BEE00.2D1', hits=None):
+
+    dsdProtocol = 'P25'
+    dsdPriority = '50'
+    dsdOverride = 'Normal'
+    dsdHits = dsdHitCount(hits)
+    dsdTimeStamp = clean(lastseen)
+
+    radioId = clean(radioId)
+    radioId = str(radioId)
+
+    return dsdLine(dsdProtocol, dsdNetworkId, radioId, dsdPriority, dsdOverride, dsdHits, dsdTimeStamp, dsdAliasName(alias))
+
+
+def writeDSDTgAliasRow(outfile, talkgroup, lastseen, user, alias):
+    outfile.write(dsdTgAliasText(talkgroup, lastseen, user, alias))
+
+
+def dsdFrequencyText(site, channel, frequency, use, alias, dsdNetworkId='BEE00.2D1'):
+
+    # line format: protocol, networkID, site, channel, frequency in MHz, "alias"
+
+    return ('P25'
+            + ',    ' + dsdNetworkId
+            + ',    ' + clean(site)
+            + ',    ' + clean(channel)
+            + ',    ' + frequency
+            + ',    \"' + dsdAliasName(alias) + ' ' + use + '\"\n')
+
+
+def sdrChannelText(system, site, frequencies, listname='NSWGRN', order=1):
+
+    # A P25 control channel for the SDRTrunk playlist. With more than one
+    # frequency SDRTrunk tries each in turn until it finds the control
+    # channel.
+
+    system = sdrAliasName(system)
+    site = sdrAliasName(site)
+
+    if len(frequencies) == 1:
+        source = ('    <source_configuration type=\"sourceConfigTuner\" frequency=\"' + frequencies[0]
+                  + '\" source_type=\"TUNER\"/>\n')
+    else:
+        source = ('    <source_configuration type=\"sourceConfigTunerMultipleFrequency\"'
+                  + ' frequency_rotation_delay=\"400\" source_type=\"TUNER_MULTIPLE_FREQUENCIES\">\n'
+                  + ''.join('      <frequency>' + frequency + '</frequency>\n' for frequency in frequencies)
+                  + '    </source_configuration>\n')
+
+    return ('  <channel system=\"' + system
+            + '\" site=\"' + site
+            + '\" name=\"' + site
+            + '\" enabled=\"false\" order=\"' + str(order)
+            + '\">\n    <alias_list_name>' + listname
+            + '</alias_list_name>\n    <event_log_configuration/>\n'
+            + source
+            + '    <aux_decode_configuration/>\n'
+            + '    <decode_configuration type=\"decodeConfigP25Phase1\" modulation=\"C4FM\"'
+            + ' traffic_channel_pool_size=\"20\" ignore_data_calls=\"false\"/>\n'
+            + '    <record_configuration/>\n  </channel>\n')
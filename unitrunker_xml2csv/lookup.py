@@ -0,0 +1,222 @@
+# Lookup server.
+#
+# Keeps an in-memory index of the TalkGroups and Radio IDs in a Unitrunker
+# XML file and answers lookups over HTTP, on localhost or a Unix socket,
+# so other tools can turn an ID into a label without re-running the
+# export. Labels are worked out just as for the export (prepare_radio(),
+# so uCase, check_label and include_rid apply). When the XML changes the
+# index is rebuilt in a background thread and swapped in whole; requests
+# carry on being answered from the old index in the meantime.
+#
+#   GET  /tg/<id>  /rid/<id>          one record, 404 if unknown
+#   GET  /tg?id=1,2  /rid?id=1&id=2   several, null for the unknown
+#   POST /lookup  {"tg": [...], "rid": [...]}
+#   GET  /status
+#
+# Add system=<System id> to look an ID up in one System of a multi-system
+# file. Without it the first System holding the ID answers.
+
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import socketserver
+import stat
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+from xml.etree import ElementTree
+
+from .cache import load_records
+from .rules import load_rules, prepare_group, prepare_radio
+from .watch import file_signature, inotify_waiter, wait_until_stable
+
+
+class LookupIndex:
+
+    # The TalkGroups and Radio IDs of one version of the XML, keyed by id
+    # and by (system, id). Never changed once built.
+
+    def __init__(self, xmlSourceFile, settings):
+        if os.path.exists(settings['ridRulesFile']):
+            rules = load_rules(settings['ridRulesFile'])
+        else:
+            rules = load_rules()
+
+        self.signature = file_signature(xmlSourceFile)
+        self.groups = {}
+        self.users = {}
+        self.systemGroups = {}
+        self.systemUsers = {}
+
+        for record in load_records(xmlSourceFile, settings):
+            if record.kind == 'Group':
+                tg = prepare_group(record)
+                if tg is not None:
+                    self.add(self.groups, self.systemGroups, tg, {})
+            elif record.kind == 'User':
+                radio, exported = prepare_radio(record, settings['createGenericRids'], rules)
+                if radio is not None:
+                    self.add(self.users, self.systemUsers, radio, {'exported': exported})
+
+        self.loaded = datetime.now().isoformat(timespec='seconds')
+
+    def add(self, byId, bySystem, record, extra):
+        entry = {'id': record.id, 'label': record.label, 'brief': record.brief, 'last': record.last,
+                 'notes': record.notes, 'hits': int(record.hits) if record.hits and record.hits.isdigit() else None,
+                 'system': record.system}
+        entry.update(extra)
+        byId.setdefault(record.id, entry)
+        bySystem.setdefault((record.system, record.id), entry)
+
+    def lookup(self, kind, recordId, system=None):
+        recordId = str(recordId).strip()
+        if kind == 'tg':
+            byId, bySystem = self.groups, self.systemGroups
+        else:
+            byId, bySystem = self.users, self.systemUsers
+        if system is None:
+            return byId.get(recordId)
+        return bySystem.get((str(system), recordId))
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'  # Keep connections open between lookups
+    wbufsize = 65536  # Headers and body go out in one send, not held back by Nagle
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        system = query.get('system', [None])[0]
+        parts = url.path.strip('/').split('/')
+        index = self.server.index  # One index for the whole request
+
+        if parts == ['status']:
+            self.reply(200, self.server.status())
+        elif len(parts) == 2 and parts[0] in ('tg', 'rid'):
+            entry = index.lookup(parts[0], parts[1], system)
+            if entry is None:
+                self.reply(404, {'error': parts[0] + ' ' + parts[1] + ' not found'})
+            else:
+                self.reply(200, entry)
+        elif len(parts) == 1 and parts[0] in ('tg', 'rid'):
+            ids = [recordId for value in query.get('id', []) for recordId in value.split(',') if recordId]
+            self.reply(200, {recordId: index.lookup(parts[0], recordId, system) for recordId in ids})
+        else:
+            self.reply(404, {'error': 'unknown path ' + url.path})
+
+    def do_POST(self):
+        if urlsplit(self.path).path.strip('/') != 'lookup':
+            self.reply(404, {'error': 'unknown path ' + self.path})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            system = request.get('system')
+            index = self.server.index
+            self.reply(200, {kind: {str(recordId): index.lookup(kind, recordId, system)
+                                    for recordId in request.get(kind, [])}
+                             for kind in ('tg', 'rid') if kind in request})
+        except (ValueError, AttributeError, TypeError) as error:
+            self.reply(400, {'error': 'bad lookup: ' + str(error)})
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        pass  # A line per lookup would swamp the console
+
+
+class LookupServer:
+
+    # The parts shared by the TCP and Unix socket servers: the current
+    # index, its status and the thread that reloads it
+
+    daemon_threads = True
+
+    def start_lookups(self, xmlSourceFile, settings, interval, settle):
+        self.xmlSourceFile = xmlSourceFile
+        self.settings = settings
+        self.reloads = 0
+        self.index = LookupIndex(xmlSourceFile, settings)
+        reloader = threading.Thread(target=self.reload_forever, args=(interval, settle), name='reload', daemon=True)
+        reloader.start()
+
+    def status(self):
+        index = self.index
+        return {'xml': self.xmlSourceFile, 'loaded': index.loaded, 'reloads': self.reloads,
+                'talkgroups': len(index.groups), 'radioIds': len(index.users)}
+
+    def reload_forever(self, interval, settle):
+        # The same change detection as watch mode
+        wait = inotify_waiter(self.xmlSourceFile)
+        if wait is None:
+            wait = lambda timeout: time.sleep(interval)
+            timeout = interval
+        else:
+            timeout = 60
+        while True:
+            wait(timeout)
+            if file_signature(self.xmlSourceFile) in (None, self.index.signature):
+                continue
+            wait_until_stable(self.xmlSourceFile, settle)
+            try:
+                index = LookupIndex(self.xmlSourceFile, self.settings)
+            except (ElementTree.ParseError, OSError) as error:
+                # Half written file - try again when it changes
+                print("Kept the old index: " + str(error))
+                continue
+            self.index = index  # Swapped in whole
+            self.reloads = self.reloads + 1
+            print(datetime.now().strftime('%H:%M:%S') + " Reloaded " + str(len(index.groups)) + " talkgroups and "
+                  + str(len(index.users)) + " radio IDs")
+
+
+class TcpLookupServer(LookupServer, ThreadingHTTPServer):
+    pass
+
+
+class UnixLookupServer(LookupServer, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def is_socket(path):
+    return stat.S_ISSOCK(os.stat(path).st_mode)
+
+
+def serve(xmlSourceFile, settings, host='127.0.0.1', port=8470, socketPath=None, interval=2.0, settle=5.0):
+
+    # Answer lookups until Ctrl+C, on socketPath if given, otherwise on
+    # host:port
+
+    if socketPath:
+        if os.path.exists(socketPath):
+            if not is_socket(socketPath):
+                raise FileExistsError(socketPath + ' is already there and is not a socket')
+            os.remove(socketPath)  # Left behind by an earlier run
+        server = UnixLookupServer(socketPath, LookupHandler)
+        where = socketPath
+    else:
+        server = TcpLookupServer((host, port), LookupHandler)
+        where = 'http://' + host + ':' + str(server.server_address[1])
+
+    try:
+        server.start_lookups(xmlSourceFile, settings, interval, settle)
+        print("Serving " + str(len(server.index.groups)) + " talkgroups and " + str(len(server.index.users))
+              + " radio IDs from " + xmlSourceFile + " on " + where + " - press Ctrl+C to stop")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped serving")
+    finally:
+        server.server_close()
+        if socketPath and os.path.exists(socketPath):
+            os.remove(socketPath)
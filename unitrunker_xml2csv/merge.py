@@ -0,0 +1,196 @@
+# Merging into existing SDRTrunk and DSD+ files.
+
+from xml.etree import ElementTree
+import json
+import os
+import re
+import shutil
+
+from .formats import dsdLine
+
+
+def merge_dsd_file(aliasFile, entries):
+
+    # Merge entries {(protocol, network, id): (alias, hits, timestamp)} into
+    # a DSD+ alias file. The file is streamed line by line into a temporary
+    # copy, new entries are added at the end and the copy then replaces the
+    # original with an atomic rename. Lines are written with the file's own
+    # line endings, CRLF for a new file as DSD+ on Windows has them. Returns
+    # the number added and updated.
+
+    entries = dict(entries)
+    updated = 0
+    newline = '\r\n'
+
+    with open(aliasFile + '.tmp', 'w', newline='') as outfile:
+        if os.path.exists(aliasFile):
+            shutil.copy2(aliasFile, aliasFile + '.bak')
+            with open(aliasFile, newline='') as infile:
+                first = infile.readline()
+                newline = first[len(first.rstrip('\r\n')):] or newline
+                infile.seek(0)
+                line = newline
+                for line in infile:
+                    fields = [field.strip() for field in line.split(',', 7)]
+                    key = tuple(fields[:3])
+                    if len(fields) < 8 or key not in entries:
+                        outfile.write(line)
+                        continue
+
+                    alias, hits, timestamp = entries.pop(key)
+                    dsdPriority, dsdOverride, dsdHits, dsdTimeStamp = fields[3:7]
+                    if dsdHits.isdigit() and int(dsdHits) > hits:
+                        hits = int(dsdHits)
+                    if dsdTimeStamp > timestamp:
+                        timestamp = dsdTimeStamp
+                    line = dsdLine(key[0], key[1], key[2], dsdPriority, dsdOverride,
+                                   str(hits), timestamp, alias, newline)
+                    outfile.write(line)
+                    updated = updated + 1
+                if entries and not line.endswith(('\r', '\n')):
+                    outfile.write(newline)  # The last line had no line ending
+
+        for key, (alias, hits, timestamp) in entries.items():
+            outfile.write(dsdLine(key[0], key[1], key[2], '50', 'Normal', str(hits), timestamp, alias, newline))
+
+    os.replace(aliasFile + '.tmp', aliasFile)
+
+    return len(entries), updated
+
+
+def sdr_alias_keys(alias):
+    listname = alias.get('list')
+    for aliasId in alias.findall('id'):
+        if aliasId.get('type') in ('talkgroup', 'radio'):
+            yield aliasId.get('type'), aliasId.get('value'), aliasId.get('protocol'), listname
+
+
+class CommentTreeBuilder(ElementTree.TreeBuilder):
+    # TreeBuilder(insert_comments=True) for Python 3.7, which doesn't have it
+    def comment(self, text):
+        self.start(ElementTree.Comment, {})
+        self.data(text)
+        return self.end(ElementTree.Comment)
+
+
+def xml_prolog(data):
+    # What comes before the root element of an XML file - its declaration,
+    # comments and DOCTYPE - byte for byte
+    position = 0
+    while True:
+        start = data.find(b'<', position)
+        if start < 0:
+            return b''
+        if data.startswith(b'<!--', start):
+            end = data.find(b'-->', start) + 3
+        elif data.startswith(b'<?', start):
+            end = data.find(b'?>', start) + 2
+        elif data.startswith(b'<!', start):
+            end = data.find(b'>', start) + 1
+        else:
+            return data[:start]
+        if end < start:
+            return b''
+        position = end
+
+
+def xml_epilog(data):
+    # What comes after the root element: the trailing comments and newline
+    end = len(data.rstrip())
+    while data.endswith(b'-->', 0, end):
+        start = data.rfind(b'<!--', 0, end)
+        if start < 0:
+            break
+        end = len(data[:start].rstrip())
+    return data[end:]
+
+
+def merge_sdr_playlist(playlistFile, aliases):
+
+    # Upsert aliases {(id type, value, protocol, list): (name, group)} into
+    # an SDRTrunk playlist.xml and write it back with an atomic rename.
+    # The playlist is SDRTrunk's, so its comments, declaration and anything
+    # else around the root element are kept as they were. Returns the number
+    # of aliases added and renamed.
+
+    indexFile = playlistFile + '.unitrunker.json'
+    written = {}
+    if os.path.exists(indexFile):
+        with open(indexFile, encoding='utf-8') as index:
+            written = json.load(index)
+
+    prolog = b"<?xml version='1.0' encoding='UTF-8'?>\n"
+    epilog = b'\n'
+    encoding = 'UTF-8'
+    if os.path.exists(playlistFile):
+        with open(playlistFile, 'rb') as infile:
+            data = infile.read()
+        try:
+            builder = ElementTree.TreeBuilder(insert_comments=True, insert_pis=True)
+        except TypeError:  # Python 3.7
+            builder = CommentTreeBuilder()
+        parser = ElementTree.XMLParser(target=builder)
+        parser.feed(data)
+        tree = ElementTree.ElementTree(parser.close())
+        prolog = xml_prolog(data)
+        epilog = xml_epilog(data)
+        declared = re.match(rb'<\?xml[^>]*encoding=["\']([A-Za-z0-9._-]+)', prolog)
+        encoding = declared.group(1).decode('ascii') if declared else 'UTF-8'
+        shutil.copy2(playlistFile, playlistFile + '.bak')
+    else:
+        tree = ElementTree.ElementTree(ElementTree.Element('playlist'))
+    playlist = tree.getroot()
+
+    # One pass to index the aliases already in the playlist
+    existing = {}
+    lastAlias = -1
+    for position, alias in enumerate(playlist):
+        if alias.tag != 'alias':
+            continue
+        lastAlias = position
+        for key in sdr_alias_keys(alias):
+            existing.setdefault(key, alias)
+
+    added = []
+    renamed = 0
+    for key, (name, group) in aliases.items():
+        indexKey = '|'.join(key)
+        alias = existing.get(key)
+        if alias is None:
+            alias = ElementTree.Element('alias', name=name, color='0')
+            if group is not None:
+                alias.set('group', group)
+            alias.set('list', key[3])
+            aliasId = ElementTree.SubElement(alias, 'id', type=key[0], value=key[1], protocol=key[2])
+            alias.text = '\n    '
+            aliasId.tail = '\n  '
+            alias.tail = '\n  '
+            added.append(alias)
+            existing[key] = alias
+        elif alias.get('name') != name and written.get(indexKey) == alias.get('name'):
+            alias.set('name', name)
+            renamed = renamed + 1
+        elif written.get(indexKey) != alias.get('name'):
+            continue  # Not ours, or edited in SDRTrunk since - leave it be
+        written[indexKey] = name
+
+    if added:
+        if lastAlias < 0:
+            playlist.text = playlist.text or '\n  '
+            lastAlias = len(playlist) - 1
+        elif playlist[lastAlias].tail is not None:
+            added[-1].tail = playlist[lastAlias].tail
+            playlist[lastAlias].tail = '\n  '
+        playlist[lastAlias + 1:lastAlias + 1] = added
+
+    with open(playlistFile + '.tmp', 'wb') as outfile:
+        outfile.write(prolog)
+        tree.write(outfile, encoding=encoding, xml_declaration=False)
+        outfile.write(epilog)
+    os.replace(playlistFile + '.tmp', playlistFile)
+
+    with open(indexFile + '.tmp', 'w', encoding='utf-8') as index:
+        json.dump(written, index, separators=(',', ':'))
+    os.replace(indexFile + '.tmp', indexFile)
+
+    return len(added), renamed
@@ -0,0 +1,167 @@
+# Per-System partitioning.
+#
+# A Unitrunker file can hold several trunked systems. Rather than parse the
+# whole file in one process, the System elements are found with a quick
+# byte scan and each System is then parsed and exported on its own - with
+# its own output files, SDRTrunk list name, DSD+ network ID and rules - so
+# the Systems can be converted in parallel.
+
+import mmap
+import re
+from xml.etree import ElementTree
+
+
+systemTag = re.compile(rb'<System[\s/>]')
+
+
+def tag_end(data, start):
+    # Position just past the '>' closing the tag at start. Attribute values
+    # may hold a '>', so skip over anything quoted.
+    quote = None
+    position = start
+    while True:
+        char = data[position:position + 1]
+        if not char:
+            raise ValueError('unterminated tag at byte ' + str(start))
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in (b'"', b"'"):
+            quote = char
+        elif char == b'>':
+            return position + 1
+        position = position + 1
+
+
+def scan_systems(xmlSourceFile):
+
+    # Find the System elements of a Unitrunker XML file without parsing it.
+    # Returns the file's header (the XML declaration and the root element's
+    # start tag) and a list of (attributes, start, end) byte ranges, one per
+    # System in file order.
+
+    systems = []
+    with open(xmlSourceFile, 'rb') as xml, mmap.mmap(xml.fileno(), 0, access=mmap.ACCESS_READ) as data:
+
+        # Skip the declaration, comments and doctype to the root start tag
+        position = data.find(b'<')
+        while position >= 0 and data[position + 1:position + 2] in (b'?', b'!'):
+            if data[position:position + 4] == b'<!--':
+                position = data.find(b'<', data.find(b'-->', position) + 3)
+            else:
+                position = data.find(b'<', tag_end(data, position))
+        if position < 0:
+            raise ValueError(xmlSourceFile + ' has no root element')
+        header = data[:tag_end(data, position)]
+
+        position = len(header)
+        while True:
+            found = systemTag.search(data, position)
+            if found is None:
+                break
+            start = found.start()
+            startEnd = tag_end(data, start)
+            startTag = data[start:startEnd]
+            if startTag.endswith(b'/>'):
+                position = startEnd  # An empty System has nothing to export
+                continue
+            end = data.find(b'</System>', startEnd)
+            if end < 0:
+                raise ValueError(xmlSourceFile + ' System at byte ' + str(start) + ' is not closed')
+            end = end + len(b'</System>')
+            attributes = ElementTree.fromstring(startTag + b'</System>').attrib
+            systems.append((attributes, start, end))
+            position = end
+
+    return header, systems
+
+
+class SystemSlice:
+
+    # A file-like view of one System of a Unitrunker XML file, wrapped in
+    # the file's header and a closing root tag so it parses as a complete
+    # Unitrunker file. Picklable, so it can be handed to a worker process,
+    # which opens the file on the first read().
+
+    def __init__(self, xmlSourceFile, header, start, end, name):
+        self.xmlSourceFile = xmlSourceFile
+        self.header = header
+        self.footer = b'</' + re.search(rb'<([^\s?!/>]+)[^<]*$', header).group(1) + b'>'
+        self.start = start
+        self.end = end
+        self.name = name
+        self.pieces = None
+        self.infile = None
+
+    def __getstate__(self):
+        # A copy always reads from the beginning
+        state = dict(self.__dict__)
+        state['pieces'] = None
+        state['infile'] = None
+        return state
+
+    def __str__(self):
+        return self.name
+
+    def read(self, size=-1):
+        if self.pieces is None:
+            self.pieces = [self.header, None, self.footer]
+            self.infile = open(self.xmlSourceFile, 'rb')
+            self.infile.seek(self.start)
+            self.position = self.start
+
+        if size is None or size < 0:
+            size = len(self.header) + self.end - self.start + len(self.footer)
+
+        data = b''
+        while self.pieces and len(data) < size:
+            if self.pieces[0] is not None:
+                data += self.pieces.pop(0)
+                continue
+            chunk = self.infile.read(min(size - len(data), self.end - self.position))
+            self.position += len(chunk)
+            data += chunk
+            if self.position >= self.end or not chunk:
+                self.pieces.pop(0)
+                self.close()
+        return data
+
+    def close(self):
+        if self.infile is not None:
+            self.infile.close()
+            self.infile = None
+
+
+def system_settings(settings, attributes):
+
+    # Settings for one System: the System's entry in settings['systems']
+    # (by id) overrides the rest, and unless it says otherwise the DSD+
+    # network ID is made from the System's WACN and system ID.
+
+    systemSettings = dict(settings)
+    if attributes.get('wacn') and attributes.get('sysid'):
+        systemSettings['dsdNetworkId'] = attributes['wacn'] + '.' + attributes['sysid']
+    systemSettings.update(settings['systems'].get(attributes.get('id'), {}))
+    return systemSettings
+
+
+def system_prefix(attributes, number):
+    # Output file prefix for a System, from its id where it has one
+    systemId = re.sub(r'[^\w.-]', '_', attributes.get('id') or str(number))
+    return 'System' + systemId + '_'
+
+
+def system_jobs(xmlSourceFile, settings, prefix=''):
+
+    # One (name, source, settings, prefix) conversion job per System in the
+    # file. source is a SystemSlice that convert() reads like a file.
+
+    header, systems = scan_systems(xmlSourceFile)
+    jobs = []
+    for number, (attributes, start, end) in enumerate(systems, start=1):
+        name = xmlSourceFile + ' System ' + (attributes.get('id') or str(number))
+        if attributes.get('label'):
+            name = name + ' (' + attributes['label'] + ')'
+        jobs.append((name, SystemSlice(xmlSourceFile, header, start, end, name),
+                     system_settings(settings, attributes), prefix + system_prefix(attributes, number)))
+    return jobs
@@ -0,0 +1,162 @@
+# Threaded export pipeline.
+#
+# Splits the export into stages joined by bounded queues: the XML is parsed
+# in a thread of its own, the TalkGroups and Radio IDs are filtered and
+# labelled in the calling thread, and each output sink writes in a thread
+# of its own. Records travel in batches so the queues cost little per
+# record. Every sink still gets the same calls in the same order as in the
+# single threaded export, so the outputs are identical.
+#
+# The stages share the interpreter lock, so what overlaps is mostly the
+# waiting - on the disk, on compression and on SQLite - rather than the
+# Python work itself.
+
+import queue
+import threading
+
+
+batchSize = 1000  # Records or sink calls passed at a time
+queueDepth = 8  # Batches a stage can get ahead of the next
+
+
+def threaded_records(records, batchSize=batchSize, depth=queueDepth):
+
+    # Yield the items of records, which are produced ahead in a thread of
+    # their own. An exception in the thread is raised here. Stopping early
+    # stops the thread too.
+
+    batches = queue.Queue(depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            batch = []
+            for item in records:
+                batch.append(item)
+                if len(batch) >= batchSize:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch and not put(batch):
+                return
+            put(None)
+        except BaseException as error:
+            put(error)
+
+    thread = threading.Thread(target=produce, name='xml-parse', daemon=True)
+    thread.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            if isinstance(batch, BaseException):
+                raise batch
+            yield from batch
+    finally:
+        stop.set()
+        thread.join()
+
+
+class SinkThreads:
+
+    # Feeds a set of output sinks, each running in a thread of its own. The
+    # export calls system(), group() and radio() on it as it would on a
+    # sink; the calls are gathered into batches and every batch is handed
+    # to each sink's thread, which makes the calls on its sink in order.
+    #
+    # Everything a sink does with its file, opening it included, happens in
+    # its thread - SQLite connections can only be used by the thread that
+    # made them. If a sink fails its thread aborts it and drops the rest of
+    # its calls, and the error is raised at the next batch or at close().
+
+    def __init__(self, sinks, fileNames, batchSize=batchSize, depth=queueDepth):
+        self.batchSize = batchSize
+        self.calls = []
+        self.workers = [SinkThread(sink, fileNames[key], depth) for key, sink in sinks.items()]
+
+    def system(self, record):
+        self.call('system', (record,))
+
+    def group(self, record):
+        self.call('group', (record,))
+
+    def radio(self, record, exported):
+        self.call('radio', (record, exported))
+
+    def channel(self, record):
+        self.call('channel', (record,))
+
+    def call(self, name, args):
+        self.calls.append((name, args))
+        if len(self.calls) >= self.batchSize:
+            for worker in self.workers:
+                worker.send(self.calls)
+            self.calls = []
+
+    def close(self):
+        calls = self.calls + [('close', ())]
+        for worker in self.workers:
+            worker.finish(calls)
+        for worker in self.workers:
+            if worker.error is not None:
+                raise worker.error
+
+    def abort(self):
+        # Called while another error is being raised, so don't add to it
+        calls = self.calls + [('abort', ())]
+        for worker in self.workers:
+            worker.finish(calls)
+
+
+class SinkThread:
+
+    # One sink and the thread making the calls on it
+
+    def __init__(self, sink, fileName, depth=queueDepth):
+        self.sink = sink
+        self.queue = queue.Queue(depth)
+        self.error = None
+        self.queue.put([('open', (fileName,))])
+        self.thread = threading.Thread(target=self.run, name='sink-' + str(sink.key), daemon=True)
+        self.thread.start()
+
+    def send(self, calls):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(calls)
+
+    def finish(self, calls):
+        if self.thread is None:
+            return
+        self.queue.put(calls)
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def run(self):
+        sink = self.sink
+        while True:
+            calls = self.queue.get()
+            if calls is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                for name, args in calls:
+                    getattr(sink, name)(*args)
+            except BaseException as error:
+                self.error = error
+                try:
+                    sink.abort()
+                except Exception:
+                    pass
@@ -0,0 +1,149 @@
+# Reading Unitrunker XML.
+#
+# The XML is streamed and each Group, User and Site Channel element boiled
+# down to a small Record, so callers can work through very large files a
+# record at a time. The field helpers tidy up the raw attribute values.
+
+from collections import namedtuple
+from xml.etree import ElementTree
+
+from .compression import open_xml
+
+
+def clean(field):
+    if field is None:
+        field = ''
+        return field
+    else:
+        return field
+
+
+def uCase(field):
+    if field is not None:
+        field = field.upper()
+    return field
+
+
+def get_last(seen):
+    if seen is not None:
+        slicetime = seen[6:8] + '/' + seen[4:6] + '/' + seen[:4]
+        return slicetime
+
+
+def get_last_dsd(seen):
+    # in format last="20200917180302"
+    # out format last="2020/09/17 18:03"
+    if seen is not None:
+        dsdtime = seen[:4] + '/' + seen[4:6] + '/' + seen[6:8] + ' ' + seen[8:10] + ':' + seen[10:12]
+        return dsdtime
+
+
+def formatFrequency(frequency):
+    # in format hz="851012500"
+    # out format 851.012500 (MHz)
+    if frequency is not None and frequency.isnumeric():
+        megahertz, hertz = divmod(int(frequency), 1000000)
+        frequency = str(megahertz) + '.' + format(hertz, '06d')
+        return frequency
+
+
+def hex2dec(hexstring):
+    try:
+        decimalvalue = int(hexstring, 16)
+        return decimalvalue
+    except:
+        decimalvalue = ''
+        return decimalvalue
+
+
+def iter_twigs(xmlSourceFile, streamXml='yes'):
+
+    # Yield the second level elements (Group, User etc.) of the Unitrunker XML,
+    # each with the first level element (System) it belongs to.
+    # When streaming, each element is handed over as soon as its end tag is
+    # read and is then cleared and detached from its parent, so memory stays
+    # flat no matter how many records the file holds.
+    # A gzip, bzip2 or xz compressed file is decompressed as it is read.
+
+    source = open_xml(xmlSourceFile)
+    try:
+        if streamXml != 'yes':
+            for branch in ElementTree.parse(source).getroot():
+                for twig in branch:
+                    yield branch, twig
+            return
+
+        parents = []
+        for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                parents.append(elem)
+                continue
+
+            parents.pop()
+            depth = len(parents)
+
+            if depth == 2:
+                yield parents[-1], elem
+                elem.clear()
+                parents[-1].remove(elem)
+            elif depth == 1:
+                elem.clear()
+                parents[-1].remove(elem)
+    finally:
+        if source is not xmlSourceFile:
+            source.close()
+
+
+# A System record is yielded ahead of its Groups and Users, with the
+# System's type in brief. system is the id of the System a record is in.
+# Each Channel of a Site is a Channel record with the Site's id in site and
+# its label in label, the frequency in Hz in hz and 'control' or 'voice'
+# in brief.
+Record = namedtuple('Record', 'kind id brief label last notes hits system site hz', defaults=(None, None, None))
+
+
+def is_control(channel):
+    return channel.get('control') not in (None, '', '0', 'no', 'false')
+
+
+def iter_records(xmlSourceFile, streamXml='yes'):
+    branch = None
+    system = None
+    for parent, twig in iter_twigs(xmlSourceFile, streamXml):
+        if parent is not branch:
+            branch = parent
+            system = None
+            if branch.tag == 'System':
+                system = branch.get('id')
+                yield Record('System', system, branch.get('type'), branch.get('label'), None, None, None, system)
+
+        if twig.tag == 'Group' or twig.tag == 'User':
+            yield Record(twig.tag, twig.get('id'), twig.get('brief'), twig.get('label'),
+                         twig.get('last'), twig.get('notes'), twig.get('hits'), system)
+        elif twig.tag == 'Site':
+            # The Channels come with their Site, in the same pass
+            site = twig.get('id')
+            for channel in twig.iter('Channel'):
+                yield Record('Channel', channel.get('id'), 'control' if is_control(channel) else 'voice',
+                             twig.get('label'), None, None, None, system, site, channel.get('hz'))
+
+
+def iter_groups(xmlSourceFile, streamXml='yes'):
+    # Just the TalkGroups
+    for record in iter_records(xmlSourceFile, streamXml):
+        if record.kind == 'Group':
+            yield record
+
+
+def iter_users(xmlSourceFile, streamXml='yes'):
+    # Just the Radio IDs. Use rules.prepare_radio() for the exported callsign.
+    for record in iter_records(xmlSourceFile, streamXml):
+        if record.kind == 'User':
+            yield record
+
+
+def iter_channels(xmlSourceFile, streamXml='yes'):
+    # Just the Site Channels. Use formatFrequency() for the frequency in MHz.
+    for record in iter_records(xmlSourceFile, streamXml):
+        if record.kind == 'Channel':
+            yield record
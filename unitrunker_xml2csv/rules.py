@@ -0,0 +1,266 @@
+# Radio ID range rules.
+#
+# Decides which Radio IDs are exported and builds generic labels for
+# unlabelled ones from range tables compiled into a sorted interval index.
+
+from bisect import bisect_left, bisect_right
+import csv
+
+from .records import clean, uCase
+
+
+# Radio IDs of known encrypted users and noise - not exported
+exclusions = {
+    1: {"rangeStart": 210000, "rangeEnd": 799999, "label": "encrypted user"},
+    2: {"rangeStart": 2100000, "rangeEnd": 2100999, "label": "encrypted user"},
+    3: {"rangeStart": 2110000, "rangeEnd": 2119999, "label": "encrypted user"},
+    4: {"rangeStart": 2120000, "rangeEnd": 2129999, "label": "encrypted user"},
+    5: {"rangeStart": 2175000, "rangeEnd": 2175999, "label": "encrypted user"},
+    6: {"rangeStart": 2600000, "rangeEnd": 2600099, "label": "encrypted user"},
+    7: {"rangeStart": 2659000, "rangeEnd": 2659499, "label": "encrypted user"},
+    8: {"rangeStart": 2659500, "rangeEnd": 2659599, "label": "encrypted user"},
+    9: {"rangeStart": 2661000, "rangeEnd": 2661999, "label": "encrypted user"},
+    10: {"rangeStart": 9020000, "rangeEnd": 9025000, "label": "encrypted user"},
+    11: {"rangeStart": 9253000, "rangeEnd": 9256999, "label": "encrypted user"},
+    12: {"rangeStart": 0, "rangeEnd": 9999, "label": "noise"}
+}
+
+# Service ranges used to build a generic tag for unlabelled Radio IDs
+genericRids = {
+    1: {"rangeStart": 2000000, "rangeEnd": 2009999, "label": "FRNSW", "labelDigits": 5},
+    2: {"rangeStart": 2010000, "rangeEnd": 2039999, "label": "RFS", "labelDigits": 5},
+    3: {"rangeStart": 2044000, "rangeEnd": 2069999, "label": "SES", "labelDigits": 5},
+    4: {"rangeStart": 2070000, "rangeEnd": 2079999, "label": "FRNSW", "labelDigits": 5},
+    5: {"rangeStart": 2130000, "rangeEnd": 2130099, "label": "YTH JSTCE", "labelDigits": 3},
+    6: {"rangeStart": 2220000, "rangeEnd": 2221999, "label": "AUSGRID", "labelDigits": 4},
+    7: {"rangeStart": 2230000, "rangeEnd": 2230999, "label": "INTEGRAL", "labelDigits": 3},
+    8: {"rangeStart": 2240000, "rangeEnd": 2240199, "label": "HTR WTR", "labelDigits": 3},
+    9: {"rangeStart": 2300000, "rangeEnd": 2300599, "label": "ARTC", "labelDigits": 3},
+    10: {"rangeStart": 2310000, "rangeEnd": 2331999, "label": "AMBO", "labelDigits": 5},
+    11: {"rangeStart": 2350000, "rangeEnd": 2350999, "label": "SYD FERRY", "labelDigits": 3},
+    12: {"rangeStart": 2370000, "rangeEnd": 2379999, "label": "RAILCORP", "labelDigits": 4},
+    13: {"rangeStart": 2380000, "rangeEnd": 2380999, "label": "RMS.Roads", "labelDigits": 4},
+    14: {"rangeStart": 2390000, "rangeEnd": 2390099, "label": "HATZOLAH", "labelDigits": 3},
+    15: {"rangeStart": 2420000, "rangeEnd": 2420999, "label": "DPIE.Parks", "labelDigits": 3},
+    16: {"rangeStart": 2430000, "rangeEnd": 2439999, "label": "RMS.Maritime", "labelDigits": 4},
+    17: {"rangeStart": 2448000, "rangeEnd": 2448999, "label": "Fisheries", "labelDigits": 3},
+    18: {"rangeStart": 2450000, "rangeEnd": 2459999, "label": "WaterNSW", "labelDigits": 4},
+    19: {"rangeStart": 2480000, "rangeEnd": 2480999, "label": "DPIE.Forestry", "labelDigits": 3},
+}
+
+
+def compile_ranges(table, tableName):
+
+    # Compile a range table into a sorted interval index of three parallel
+    # lists (starts, ends, infos) so a Radio ID can be found with a binary
+    # search instead of testing every range.
+    # Ranges are taken in table order and the first range listed wins, the
+    # same as the old linear scan. Overlapping ranges are reported and the
+    # later range is trimmed back to the IDs not already covered. Adjacent
+    # ranges with the same details are reported and joined into one.
+
+    starts = []
+    ends = []
+    infos = []
+
+    for row, info in table.items():
+        rangeStart = int(info["rangeStart"])
+        rangeEnd = int(info["rangeEnd"])
+
+        if rangeStart > rangeEnd:
+            print("Rule warning: " + tableName + " rule " + str(row) + " range "
+                  + str(rangeStart) + "-" + str(rangeEnd) + " is back to front - ignored")
+            continue
+
+        # Existing intervals are disjoint, so ends are sorted too
+        first = bisect_left(ends, rangeStart)
+        last = bisect_right(starts, rangeEnd)
+
+        pieces = []
+        cursor = rangeStart
+        for i in range(first, last):
+            print("Rule warning: " + tableName + " rule " + str(row) + " range "
+                  + str(rangeStart) + "-" + str(rangeEnd) + " overlaps "
+                  + str(starts[i]) + "-" + str(ends[i]) + " (" + infos[i]["label"] + ")")
+            if starts[i] > cursor:
+                pieces.append((cursor, starts[i] - 1))
+            cursor = ends[i] + 1
+        if cursor <= rangeEnd:
+            pieces.append((cursor, rangeEnd))
+
+        # Slot the uncovered pieces in between the intervals they overlapped
+        newStarts = starts[:first]
+        newEnds = ends[:first]
+        newInfos = infos[:first]
+        existing = list(range(first, last))
+        for pieceStart, pieceEnd in pieces:
+            while existing and starts[existing[0]] < pieceStart:
+                i = existing.pop(0)
+                newStarts.append(starts[i])
+                newEnds.append(ends[i])
+                newInfos.append(infos[i])
+            newStarts.append(pieceStart)
+            newEnds.append(pieceEnd)
+            newInfos.append(info)
+        for i in existing:
+            newStarts.append(starts[i])
+            newEnds.append(ends[i])
+            newInfos.append(infos[i])
+
+        starts = newStarts + starts[last:]
+        ends = newEnds + ends[last:]
+        infos = newInfos + infos[last:]
+
+    # Join adjacent ranges that carry the same label details
+    i = 1
+    while i < len(starts):
+        if ends[i - 1] + 1 == starts[i] and rule_details(infos[i - 1]) == rule_details(infos[i]):
+            print("Rule note: " + tableName + " ranges "
+                  + str(starts[i - 1]) + "-" + str(ends[i - 1]) + " and "
+                  + str(starts[i]) + "-" + str(ends[i]) + " are adjacent ("
+                  + infos[i]["label"] + ") - joined")
+            ends[i - 1] = ends[i]
+            del starts[i], ends[i], infos[i]
+        else:
+            i = i + 1
+
+    return starts, ends, infos
+
+
+def rule_details(info):
+    # Everything about a range except its bounds
+    return [(key, str(value)) for key, value in sorted(info.items())
+            if key not in ("rangeStart", "rangeEnd")]
+
+
+def find_range(index, rid):
+    # Binary search a compiled interval index for the range holding rid
+    starts, ends, infos = index
+    i = bisect_right(starts, rid) - 1
+    if i >= 0 and rid <= ends[i]:
+        return infos[i]
+
+
+def is_number(value):
+    return value is not None and value.strip().isdigit()
+
+
+def rule_problem(table, info):
+    # What is wrong with a row of the rules file, or None if it is usable
+    for column in ("rangeStart", "rangeEnd"):
+        if not is_number(info.get(column)):
+            return "has " + column + " '" + clean(info.get(column)) + "', not a whole number"
+    if info.get("label") is None:
+        return "has no label"
+    if table == "generic" and not is_number(info.get("labelDigits")):
+        return "is a generic range without a whole number of labelDigits"
+    return None
+
+
+def load_rules(rulesFile=None):
+
+    # Build the compiled rule set used by include_rid() and check_label().
+    # The rules file is a CSV with the columns:
+    #   table,rangeStart,rangeEnd,label,labelDigits
+    # where table is 'exclude' or 'generic'. labelDigits is only needed for
+    # generic ranges. A table listed in the file replaces the built in one.
+
+    tables = {"exclude": exclusions, "generic": genericRids}
+
+    if rulesFile is not None:
+        fileTables = {}
+        with open(rulesFile, newline='') as rules:
+            for row, info in enumerate(csv.DictReader(rules), start=2):
+                table = clean(info.pop("table")).strip().lower()
+                if table not in tables:
+                    print("Rule warning: " + rulesFile + " line " + str(row)
+                          + " has unknown table '" + table + "' - ignored")
+                    continue
+                if table == "exclude" or not info.get("labelDigits"):
+                    info.pop("labelDigits", None)
+                problem = rule_problem(table, info)
+                if problem is not None:
+                    print("Rule warning: " + rulesFile + " line " + str(row) + " " + problem + " - ignored")
+                    continue
+                fileTables.setdefault(table, {})[row] = info
+        tables.update(fileTables)
+
+    return {
+        "exclude": compile_ranges(tables["exclude"], "exclude"),
+        "generic": compile_ranges(tables["generic"], "generic"),
+    }
+
+
+ridRules = None
+
+
+def default_rules():
+    # Compile the built in range tables the first time they are needed
+    global ridRules
+    if ridRules is None:
+        ridRules = load_rules()
+    return ridRules
+
+
+def include_rid(rid, rules=None):
+
+    # test radioId number range to include in export list
+    # include = false for blank and encrypted users -
+    # if radioId falls in an exclusion range then return exportRid = false
+
+    rules = rules or default_rules()
+    if find_range(rules["exclude"], int(rid)) is not None:
+        exportRid = 'no'
+
+        return exportRid
+
+
+def check_label(rid, rules=None):
+
+    # We can also populate some blanks with basic data:
+    # If no radioID, create a generic service based tag
+    # using the last 'labelDigits' numbers of the RID
+
+    rules = rules or default_rules()
+    info = find_range(rules["generic"], int(rid))
+    if info is not None:
+        s_radioId = str(rid)
+        # Determine the number of digits to retrieve - varies from service to service
+        startDigit = len(rid) - int(info["labelDigits"])
+        radioUser = info["label"] + "." + s_radioId[startDigit:7]
+
+        return radioUser
+
+
+def prepare_group(record):
+    # Filter out TGs with no data. Every Group has a brief once cleaned,
+    # so in practice all TalkGroups are exported.
+    if clean(record.brief) is None:
+        return None
+    return record
+
+
+def prepare_radio(record, createGenericRids, rules=None):
+
+    # Work out the callsign for a Radio ID.
+    # Returns (None, False) for RIDs with no label, otherwise the record with
+    # its callsign in label and whether to export it - known encrypted users
+    # and noise are not exported.
+
+    radioUser = record.label
+
+    # if radioUser is None see if we can assign a generic label
+    if radioUser is None:
+        if createGenericRids == 'yes':
+            radioUser = check_label(record.id, rules)
+
+    if radioUser is None:  # Filter out RIDs with no data
+        return None, False
+
+    radioUser = uCase(radioUser)  # Comment this line out if you don't want forced upper case RID labels
+
+    # Call function to test Radio ID.
+    # If it's a known encrypted user, discard
+    exported = include_rid(record.id, rules) != 'no'
+
+    return record._replace(label=radioUser), exported
@@ -0,0 +1,56 @@
+# Choosing which Radio IDs to export when a scanner can only hold so many.
+#
+# Radio IDs can be limited to those heard in the last few days and/or to
+# the top K by hits. The top K are kept in a bounded heap during the one
+# pass over the XML, so memory stays O(K) however many Users there are,
+# and are handed back in their original order at the end.
+
+from datetime import datetime, timedelta
+import heapq
+
+
+class RadioSelection:
+
+    def __init__(self, recentDays=None, top=None, now=None):
+        self.cutoff = None
+        if recentDays is not None:
+            # Unitrunker's last="20200917180302" sorts as a string
+            self.cutoff = ((now or datetime.now()) - timedelta(days=recentDays)).strftime('%Y%m%d%H%M%S')
+        self.top = top
+        self.heap = []
+        self.sequence = 0
+
+    def recent(self, radio):
+        return self.cutoff is None or (radio.last or '') >= self.cutoff
+
+    def add(self, radio):
+
+        # Offer a radio to the top K. Returns the radio to write straight
+        # away when there's no top K, otherwise None - the chosen radios
+        # come from selected() once every record has been seen.
+
+        if self.top is None:
+            return radio
+        hits = radio.hits
+        entry = (int(hits) if hits and hits.isdigit() else 0, -self.sequence, radio)
+        self.sequence = self.sequence + 1
+        # Busiest wins, the first in the file on a tie
+        if len(self.heap) < self.top:
+            heapq.heappush(self.heap, entry)
+        elif self.heap and entry[:2] > self.heap[0][:2]:
+            heapq.heapreplace(self.heap, entry)
+        return None
+
+    def selected(self):
+        # The top K in the order they came in the XML
+        chosen = sorted(self.heap, key=lambda entry: -entry[1])
+        self.heap = []
+        return [radio for hits, sequence, radio in chosen]
+
+
+def radio_selection(settings):
+    # The selection for settings['recentDays'] and settings['topRadios'],
+    # or None when neither is set
+    if settings['recentDays'] is None and settings['topRadios'] is None:
+        return None
+    return RadioSelection(settings['recentDays'], settings['topRadios'])
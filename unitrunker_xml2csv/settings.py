@@ -0,0 +1,123 @@
+# Settings - customise these for your setup.
+#
+# These are the defaults. The command line can override most of them for a
+# single run.
+
+settings = {
+    # Set location of your UniTrunker XML file here.
+    # Other files can be given on the command line.
+    'xmlSourceFile': 'Unitrunker.xml',
+
+    # Stream the XML rather than loading the whole tree first?
+    # Set this to 'no' to parse the full file into memory before exporting.
+    'streamXml': 'yes',
+
+    # Create generic radio ids?
+    # Set this to 'no' if you want to keep displaying raw RadioIDs
+    # on your scanner.
+    'createGenericRids': 'no',
+
+    # Filter the Radio IDs in NumPy batches rather than one at a time?
+    # Much faster for multi-million User tables and the output is the same.
+    # Needs NumPy - without it the row by row filter is used.
+    'columnarFilter': 'no',
+
+    # Save the records read from the XML in a cache file next to it
+    # (Unitrunker.xml.cache) and read them from there while the XML is
+    # unchanged? Re-running with other settings then skips the XML parse.
+    'recordCache': 'no',
+
+    # Parse the XML and write each output in threads of their own, so slow
+    # disks and outputs overlap with the parsing? The outputs are the same.
+    'pipeline': 'no',
+
+    # Only export the Radio IDs heard in the last recentDays days and/or the
+    # topRadios with the most hits, for scanners that hold a limited number.
+    # None exports them all. With partitionSystems each System gets its own
+    # topRadios.
+    'recentDays': None,
+    'topRadios': None,
+
+    # Radio ID exclusion and generic label ranges.
+    # If this rules file exists it replaces the built in NSW GRN tables.
+    'ridRulesFile': 'rid_rules.csv',
+
+    # Incremental export?
+    # Set this to 'yes' to save a state file after each run. The next run
+    # then only writes new or changed records to a set of delta_ files.
+    # Set patchFullOutputs to 'yes' to also update the last full outputs.
+    'incrementalExport': 'no',
+    'stateFile': 'Unitrunker_xml2csv_state.json',
+    'patchFullOutputs': 'no',
+
+    # Outputs to write - see the sink classes in sinks.py, or run with
+    # --list-outputs. Can be changed on the command line with --output
+    # and --no-output.
+    'outputs': ['tg', 'rid', 'sdr', 'dsd', 'dsdradios', 'freq', 'dsdfreqs', 'sdrchannels'],
+
+    # Sort the outputs? 'no' keeps the order of the XML, 'id' sorts by ID,
+    # 'hits' puts the busiest first and 'last' the most recently heard.
+    # Up to sortBufferRecords records are sorted in memory, more are sorted
+    # in runs on disk (see the diff command below for sortBufferRecords).
+    'sortOutputs': 'no',
+
+    # Compress the outputs? 'no', 'gzip', 'bz2' or 'xz'. The file names get
+    # a .gz, .bz2 or .xz on the end. Files merged into (the SDRTrunk
+    # playlist, DSD+ alias files and SQLite database) are never compressed.
+    # Compressed XML input is always recognised, whatever it is called.
+    'compressOutputs': 'no',
+
+    # Export each System in the XML on its own?
+    # Set this to 'yes' to give every System its own output files (named
+    # System<id>_...) and convert the Systems in parallel. Each System's
+    # DSD+ network ID is made from its WACN and system ID. Anything outside
+    # a System element is skipped. Settings for a single System go in
+    # 'systems' under its id, e.g.
+    #   'systems': {'1': {'sdrListName': 'NSWGRN', 'ridRulesFile': 'grn_rules.csv'},
+    #               '2': {'sdrListName': 'ACT', 'dsdNetworkId': 'BEE00.1B1'}},
+    'partitionSystems': 'no',
+    'systems': {},
+
+    # SDRTrunk alias list name, and the playlist the 'playlist' output
+    # merges aliases into. Always keep a backup of your playlist - a copy
+    # is also saved as playlist.xml.bak before each merge.
+    'sdrListName': 'NSWGRN',
+    'sdrPlaylist': 'playlist.xml',
+
+    # DSD+ network ID, and the DSD+ alias files the 'dsdgroupsmerge' and
+    # 'dsdradiosmerge' outputs merge into (a .bak copy is kept).
+    'dsdNetworkId': 'BEE00.2D1',
+    'dsdGroupsFile': 'DSD+.groups',
+    'dsdRadiosFile': 'DSD+.radios',
+
+    # The diff command reports a change in a record's hits of diffHitsJump
+    # or more. Large files are sorted on disk in runs of sortBufferRecords
+    # records, which sets how much memory a sort uses - here, for
+    # sortOutputs and for the merge command.
+    'diffHitsJump': 1000,
+    'sortBufferRecords': 200000,
+
+    # How the merge command settles a label, brief or notes that differ
+    # between sites: 'recent' (the site that heard the ID last), 'hits'
+    # (the site that heard it most) or 'priority' (the site listed first).
+    'mergePolicy': 'recent',
+
+    # Where the serve command answers lookups: lookupHost:lookupPort, or the
+    # Unix socket lookupSocket if that is set.
+    'lookupHost': '127.0.0.1',
+    'lookupPort': 8470,
+    'lookupSocket': None,
+
+    # How the enrich command finds the IDs in a log: in a text log (DSD+)
+    # the first group of these regular expressions, in a CSV log (SDRTrunk
+    # call events) these columns. A pattern starting with plain text is
+    # much quicker than one starting with \b or a lookbehind.
+    'logTgPattern': r'TG=(\d+)',
+    'logRidPattern': r'RID=(\d+)',
+    'logTgColumn': 'TO',
+    'logRidColumn': 'FROM',
+
+    # SQLite database the 'sqlite' output keeps up to date, with a history
+    # of hits between runs.
+    'sqliteFile': 'Unitrunker.sqlite',
+}
@@ -0,0 +1,542 @@
+# Output sinks.
+#
+# Each output format is a sink class registered under a short name. Every
+# enabled sink gets each record from the one pass over the XML and queues
+# its output, writing it out in large batches. Sinks that aren't enabled
+# are never created, so they cost nothing.
+
+import csv
+import re
+
+from .compression import compressed_name, open_text
+from .formats import (csv_text, dsdAliasName, dsdFrequencyText, dsdRadioAliasText, dsdTgAliasText, rowFreqHead,
+                      rowRidHead, rowTgHead, sdrChannelText, sdrRadioAliasText, sdrTgAliasText)
+from .merge import merge_dsd_file, merge_sdr_playlist
+from .records import clean, formatFrequency, get_last, get_last_dsd
+
+
+outputSinks = {}
+
+
+def register_sink(sinkClass):
+    # A sink an incremental export patches (see patch_output() in export.py)
+    # must be able to split its output back into records - catch a missing
+    # chunks() now rather than part way through a delta export
+    if not (sinkClass.mergesInPlace or sinkClass.writtenInFull) and sinkClass.chunks is OutputSink.chunks:
+        raise TypeError(sinkClass.__name__ + ' must override chunks(), or set mergesInPlace or writtenInFull')
+    outputSinks[sinkClass.key] = sinkClass
+    return sinkClass
+
+
+def last_date(record):
+    # get_last() of a record - worked out ahead for a whole batch of Radio
+    # IDs by the columnar filter (columnar.py)
+    return getattr(record, 'lastDate', None) or get_last(record.last)
+
+
+def last_dsd(record):
+    return getattr(record, 'lastDsd', None) or get_last_dsd(record.last)
+
+
+class OutputSink:
+
+    key = None  # Name used in settings['outputs'] and on the command line
+    fileName = None  # Output file name, {stamp} is replaced by the date
+    description = ''
+    batchSize = 1000  # Records queued between writes
+    bufferSize = 1 << 20  # File buffer in bytes
+    mergesInPlace = False  # True for sinks that update an existing file
+    writtenInFull = False  # True for sinks a delta export rewrites in full, not as a delta
+
+    def __init__(self, settings):
+        self.settings = settings
+        # Files merged into are left as they are
+        self.compression = None
+        if not self.mergesInPlace and settings['compressOutputs'] != 'no':
+            self.compression = settings['compressOutputs']
+
+    def output_name(self, stamp, prefix=''):
+        return compressed_name(prefix + self.fileName.format(stamp=stamp), self.compression)
+
+    def open(self, fileName):
+        self.outfile = open_text(fileName, 'w', self.compression, buffering=self.bufferSize)
+        self.pending = []
+
+    def add(self, item):
+        self.pending.append(item)
+        if len(self.pending) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.outfile.write(''.join(self.pending))
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        self.outfile.close()
+
+    def abort(self):
+        # The export failed part way. Most sinks keep what they have.
+        self.close()
+
+    def system(self, record):
+        pass
+
+    def group(self, record):
+        pass
+
+    def radio(self, record, exported):
+        pass
+
+    def channel(self, record):
+        pass
+
+    # Incremental export support - the output text for a single record,
+    # the key a record is stored under in the output file and a function
+    # splitting an existing output file into (key, text) pieces.
+
+    def group_text(self, record):
+        return None
+
+    def radio_text(self, record):
+        return None
+
+    def patch_key(self, kind, recordId):
+        return None
+
+    def patch_header(self):
+        return None
+
+    def chunks(self, infile):
+        # Overridden by every sink that isn't mergesInPlace or writtenInFull,
+        # register_sink() checks
+        raise NotImplementedError
+
+
+class CsvSink(OutputSink):
+
+    # Queues rows and writes them with writerows()
+
+    header = None
+    keyColumn = 0
+
+    def open(self, fileName):
+        OutputSink.open(self, fileName)
+        self.writer = csv.writer(self.outfile)
+        self.started = False
+
+    def flush(self):
+        if self.pending:
+            self.writer.writerows(self.pending)
+            self.pending = []
+
+    def start(self):
+        # Column headers go in ahead of the first record
+        if not self.started:
+            self.add(self.header)
+            self.started = True
+
+    def patch_header(self):
+        return csv_text(self.header)
+
+    def chunks(self, infile):
+        # The header row has no key
+        for row in csv.reader(infile):
+            if row == self.header or len(row) <= self.keyColumn:
+                yield None, csv_text(row)
+            else:
+                yield row[self.keyColumn], csv_text(row)
+
+
+@register_sink
+class TalkGroupCsvSink(CsvSink):
+
+    key = 'tg'
+    fileName = 'output_TalkGroups_{stamp}.csv'
+    description = 'TalkGroup CSV'
+    header = rowTgHead
+    keyColumn = 0
+
+    def row(self, record):
+        rowTgData = []
+        rowTgData.append(record.id)  # TalkGroup ID
+        rowTgData.append(clean(record.brief))  # User - RFS, FRNSW etc
+        rowTgData.append(clean(record.label))  # TalkGroup Name
+        rowTgData.append(get_last(record.last))  # Date last seen by UniTrunker
+        rowTgData.append(clean(record.notes))  # Comments
+        rowTgData.append(clean(record.hits))  # Hits
+        return rowTgData
+
+    def group(self, record):
+        self.start()
+        self.add(self.row(record))
+
+    def group_text(self, record):
+        return csv_text(self.row(record))
+
+    def patch_key(self, kind, recordId):
+        if kind == 'Group':
+            return recordId
+
+
+@register_sink
+class RadioIdCsvSink(CsvSink):
+
+    key = 'rid'
+    fileName = 'output_RadioIds.csv_{stamp}.csv'
+    description = 'Radio ID CSV, first four columns ready for UBCD Sentinel'
+    header = rowRidHead
+    keyColumn = 1
+
+    def row(self, record):
+        rowRidData = []
+        rowRidData.append(record.label)  # Callsign
+        rowRidData.append(record.id)  # Radio ID
+        rowRidData.append('Off')
+        rowRidData.append('Off')
+        rowRidData.append(clean(record.brief))  # Tag - Short note
+        rowRidData.append(last_date(record))  # Date last seen by UniTrunker
+        rowRidData.append(clean(record.notes))  # Comments
+        rowRidData.append(clean(record.hits))  # Hits
+        return rowRidData
+
+    def radio(self, record, exported):
+        self.start()
+        if exported:
+            self.add(self.row(record))
+
+    def radio_text(self, record):
+        return csv_text(self.row(record))
+
+    def patch_key(self, kind, recordId):
+        if kind == 'User':
+            return recordId
+
+
+@register_sink
+class SdrTrunkAliasSink(OutputSink):
+
+    key = 'sdr'
+    fileName = 'playlist_Aliases_{stamp}.txt'
+    description = 'SDRTrunk aliases for pasting into playlist.xml'
+
+    def group(self, record):
+        self.add(self.group_text(record))
+
+    def radio(self, record, exported):
+        if exported:
+            self.add(self.radio_text(record))
+
+    def group_text(self, record):
+        return sdrTgAliasText(record.id, clean(record.label), self.settings['sdrListName'])
+
+    def radio_text(self, record):
+        return sdrRadioAliasText(record.id, record.label, self.settings['sdrListName'])
+
+    def patch_key(self, kind, recordId):
+        return ('talkgroup/' if kind == 'Group' else 'radio/') + recordId
+
+    def chunks(self, infile):
+        # Split into alias blocks keyed on id type and value
+        block = []
+        for line in infile:
+            block.append(line)
+            if line.strip() == '</alias>':
+                text = ''.join(block)
+                match = re.search('<id type="([^"]*)" value="([^"]*)"', text)
+                yield (match.group(1) + '/' + match.group(2) if match else None), text
+                block = []
+        if block:
+            yield None, ''.join(block)
+
+
+@register_sink
+class DsdGroupAliasSink(OutputSink):
+
+    key = 'dsd'
+    fileName = 'dsd.alias.groups_{stamp}.txt'
+    description = 'DSD+ group aliases for pasting into DSD+.groups'
+
+    def group(self, record):
+        self.add(self.group_text(record))
+
+    def group_text(self, record):
+        return dsdTgAliasText(record.id, get_last_dsd(record.last), clean(record.brief), clean(record.label),
+                              self.settings['dsdNetworkId'], record.hits)
+
+    def patch_key(self, kind, recordId):
+        if kind == 'Group':
+            return recordId
+
+    def chunks(self, infile):
+        for line in infile:
+            fields = line.split(',')
+            yield (fields[2].strip() if len(fields) >= 8 else None), line
+
+
+@register_sink
+class DsdRadioAliasSink(DsdGroupAliasSink):
+
+    key = 'dsdradios'
+    fileName = 'dsd.alias.radios_{stamp}.txt'
+    description = 'DSD+ radio aliases for pasting into DSD+.radios'
+
+    def group(self, record):
+        pass
+
+    def radio(self, record, exported):
+        if exported:
+            self.add(self.radio_text(record))
+
+    def group_text(self, record):
+        return None
+
+    def radio_text(self, record):
+        return dsdRadioAliasText(record.id, last_dsd(record), record.label, self.settings['dsdNetworkId'],
+                                 record.hits)
+
+    def patch_key(self, kind, recordId):
+        if kind == 'User':
+            return recordId
+
+
+@register_sink
+class FrequencyCsvSink(CsvSink):
+
+    key = 'freq'
+    fileName = 'output_Frequencies_{stamp}.csv'
+    description = 'Site control and voice channel frequency CSV'
+    writtenInFull = True
+    header = rowFreqHead
+
+    def channel(self, record):
+        frequency = formatFrequency(record.hz)
+        if frequency is None:
+            return  # No frequency recorded yet
+        self.start()
+        rowFreqData = []
+        rowFreqData.append(clean(record.system))  # System ID
+        rowFreqData.append(clean(record.site))  # Site ID
+        rowFreqData.append(clean(record.label))  # Site Name
+        rowFreqData.append(clean(record.id))  # Channel number
+        rowFreqData.append(frequency)  # MHz
+        rowFreqData.append(record.brief.capitalize())  # Control or Voice
+        self.add(rowFreqData)
+
+
+@register_sink
+class DsdFrequencySink(OutputSink):
+
+    key = 'dsdfreqs'
+    fileName = 'dsd.frequencies_{stamp}.txt'
+    description = 'DSD+ site channel frequencies in MHz'
+    writtenInFull = True
+
+    def channel(self, record):
+        frequency = formatFrequency(record.hz)
+        if frequency is not None:
+            self.add(dsdFrequencyText(record.site, record.id, frequency, record.brief,
+                                      clean(record.label) or 'Site ' + clean(record.site), self.settings['dsdNetworkId']))
+
+
+@register_sink
+class SdrTrunkChannelSink(OutputSink):
+
+    key = 'sdrchannels'
+    fileName = 'playlist_Channels_{stamp}.txt'
+    description = 'SDRTrunk control channels for pasting into playlist.xml'
+    writtenInFull = True
+
+    # A Site's Channels come one after another, so each Site is written
+    # out once the next one starts. SDRTrunk follows the voice channels
+    # itself, so a Site's control channels are all it needs - or all of
+    # its Channels if none is marked as the control channel. Channels are
+    # named after their System's label where it has one.
+
+    def open(self, fileName):
+        OutputSink.open(self, fileName)
+        self.systems = {}
+        self.site = None
+        self.channels = []
+        self.order = 0
+
+    def system(self, record):
+        if record.label:
+            self.systems[record.id] = record.label
+
+    def channel(self, record):
+        if formatFrequency(record.hz) is None:
+            return
+        site = (record.system, record.site)
+        if site != self.site:
+            self.write_site()
+            self.site = site
+        self.channels.append(record)
+
+    def write_site(self):
+        if not self.channels:
+            return
+        frequencies = [channel.hz for channel in self.channels if channel.brief == 'control']
+        if not frequencies:
+            frequencies = [channel.hz for channel in self.channels]
+        first = self.channels[0]
+        self.order = self.order + 1
+        self.add(sdrChannelText(self.systems.get(first.system, self.settings['sdrListName']),
+                                clean(first.label) or 'Site ' + clean(first.site), frequencies,
+                                self.settings['sdrListName'], self.order))
+        self.channels = []
+
+    def close(self):
+        self.write_site()
+        OutputSink.close(self)
+
+
+class DsdMergeSink(OutputSink):
+
+    mergesInPlace = True
+    fileSetting = None
+
+    def output_name(self, stamp, prefix=''):
+        return self.settings[self.fileSetting]
+
+    def open(self, fileName):
+        self.fileName = fileName
+        self.entries = {}
+
+    def add_entry(self, recordId, alias, record):
+        key = ('P25', self.settings['dsdNetworkId'], recordId)
+        hits = clean(record.hits)
+        self.entries[key] = (alias, int(hits) if hits.isdigit() else 0, clean(last_dsd(record)))
+
+    def close(self):
+        added, updated = merge_dsd_file(self.fileName, self.entries)
+        print("DSD+ " + self.fileName + ": " + str(added) + " aliases added, "
+              + str(updated) + " updated")
+
+
+@register_sink
+class DsdGroupMergeSink(DsdMergeSink):
+
+    key = 'dsdgroupsmerge'
+    description = 'merge group aliases straight into DSD+.groups (--dsd-groups)'
+    fileSetting = 'dsdGroupsFile'
+
+    def group(self, record):
+        self.add_entry(record.id, clean(record.brief) + '.' + dsdAliasName(record.label), record)
+
+
+@register_sink
+class DsdRadioMergeSink(DsdMergeSink):
+
+    key = 'dsdradiosmerge'
+    description = 'merge radio aliases straight into DSD+.radios (--dsd-radios)'
+    fileSetting = 'dsdRadiosFile'
+
+    def radio(self, record, exported):
+        if exported:
+            self.add_entry(record.id, dsdAliasName(record.label), record)
+
+
+@register_sink
+class SdrTrunkPlaylistSink(OutputSink):
+
+    key = 'playlist'
+    description = 'merge aliases straight into an SDRTrunk playlist.xml (--playlist)'
+    mergesInPlace = True
+
+    def output_name(self, stamp, prefix=''):
+        return self.settings['sdrPlaylist']
+
+    def open(self, fileName):
+        self.fileName = fileName
+        self.aliases = {}
+
+    def group(self, record):
+        key = ('talkgroup', record.id, 'APCO25', self.settings['sdrListName'])
+        self.aliases[key] = (clean(record.label).strip(), record.id)
+
+    def radio(self, record, exported):
+        if exported:
+            key = ('radio', record.id, 'APCO25', self.settings['sdrListName'])
+            self.aliases[key] = (record.label.strip(), None)
+
+    def close(self):
+        added, renamed = merge_sdr_playlist(self.fileName, self.aliases)
+        print("Playlist " + self.fileName + ": " + str(added) + " aliases added, "
+              + str(renamed) + " renamed")
+
+
+@register_sink
+class SqliteSink(OutputSink):
+
+    key = 'sqlite'
+    description = 'upsert everything into an SQLite database with hit history (--sqlite)'
+    mergesInPlace = True
+    batchSize = 10000
+
+    def output_name(self, stamp, prefix=''):
+        return self.settings['sqliteFile']
+
+    def open(self, fileName):
+        # sqlite3 is only loaded when this output is used
+        from datetime import datetime
+        from .database import open_database, upsertGroup, upsertSystem, upsertUser
+
+        self.run = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.connection = open_database(fileName, self.run)
+        self.statements = {'System': upsertSystem, 'Group': upsertGroup, 'User': upsertUser}
+        self.pending = {'System': [], 'Group': [], 'User': []}
+        self.counts = dict.fromkeys(self.pending, 0)
+        self.fileName = fileName
+
+    def add_row(self, kind, row):
+        pending = self.pending[kind]
+        pending.append(row)
+        if len(pending) >= self.batchSize:
+            self.write_rows(kind)
+
+    def write_rows(self, kind):
+        pending = self.pending[kind]
+        self.connection.executemany(self.statements[kind], pending)
+        self.counts[kind] += len(pending)
+        pending.clear()
+
+    def flush(self):
+        for kind, pending in self.pending.items():
+            if pending:
+                self.write_rows(kind)
+
+    def system(self, record):
+        self.add_row('System', (record.id, record.brief, record.label, self.run))
+
+    def group(self, record):
+        self.add_row('Group', (clean(record.system), record.id, record.brief, record.label, record.last,
+                               record.notes, record.hits, self.run))
+
+    def radio(self, record, exported):
+        self.add_row('User', (clean(record.system), record.id, record.brief, record.label, record.last,
+                              record.notes, record.hits, int(exported), self.run))
+
+    def close(self):
+        self.flush()
+        self.connection.execute('COMMIT')
+        self.connection.close()
+        print("SQLite " + self.fileName + ": " + str(self.counts['System']) + " systems, "
+              + str(self.counts['Group']) + " talkgroups and " + str(self.counts['User']) + " radio IDs upserted")
+
+    def abort(self):
+        # Leave the database as it was before this run
+        self.connection.execute('ROLLBACK')
+        self.connection.close()
+
+
+def create_sinks(settings):
+    return {key: outputSinks[key](settings) for key in settings['outputs']}
+
+
+def output_names(stamp, prefix, sinks):
+
+    # Output file names & locations. Customise the names in the sink classes.
+
+    return {key: sink.output_name(stamp, prefix) for key, sink in sinks.items()}
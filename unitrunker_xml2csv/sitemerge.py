@@ -0,0 +1,137 @@
+# Multi-site merge.
+#
+# Combines the Unitrunker XML files of several receiver sites into one
+# master export. Each site's file is parsed in a worker process, which
+# sorts its TalkGroups and Radio IDs by ID (on disk if there are many, see
+# extsort.py) into a temporary file. The sorted files are then read back
+# together with a k-way heapq.merge, so the same ID from every site comes
+# out side by side and no site is ever held in memory whole.
+#
+# For an ID seen at several sites the hits are added up and the latest
+# last heard kept. Where the sites disagree on a label, brief or notes the
+# merge policy decides:
+#   recent   - the site that heard it most recently
+#   hits     - the site that heard it most
+#   priority - the site listed first
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import heapq
+from itertools import groupby
+from operator import itemgetter
+import os
+import tempfile
+
+from .cache import load_records
+from .export import export_records
+from .extsort import dump_items, external_sort, read_run
+from .rules import load_rules
+from .sinks import create_sinks, output_names
+
+
+kindOrder = {'Group': 0, 'User': 1}  # TalkGroups first, as in the XML
+mergeKey = itemgetter(0, 1, 2)
+
+
+def hit_count(record):
+    return int(record.hits) if record.hits and record.hits.isdigit() else 0
+
+
+def site_entries(xmlSourceFile, site, settings):
+    # (kind order, len(id), id, site, record) for a site's TalkGroups and
+    # Radio IDs. The length ahead of the id makes numeric ids sort as numbers.
+    for record in load_records(xmlSourceFile, settings):
+        if record.kind in kindOrder:
+            yield kindOrder[record.kind], len(record.id), record.id, site, record
+
+
+def sort_site(job):
+
+    # Process pool entry point: sort one site's records by ID into a
+    # temporary file. Returns the file name and the number of records.
+
+    site, xmlSourceFile, settings, tmpDir = job
+    counter = [0]
+
+    def counted(entries):
+        for entry in entries:
+            counter[0] += 1
+            yield entry
+
+    handle, fileName = tempfile.mkstemp(suffix='.sorted', dir=tmpDir)
+    with os.fdopen(handle, 'wb') as outfile:
+        entries = counted(site_entries(xmlSourceFile, site, settings))
+        dump_items(external_sort(entries, settings['sortBufferRecords'], key=mergeKey, tmpDir=tmpDir), outfile)
+    return fileName, counter[0]
+
+
+def choose(records, field, policy):
+    # The value of field from the record the policy prefers, among the
+    # records that have one. records are in site order.
+    candidates = [record for record in records if getattr(record, field) is not None]
+    if not candidates:
+        return None
+    if policy == 'recent':
+        return getattr(max(candidates, key=lambda record: record.last or ''), field)
+    if policy == 'hits':
+        return getattr(max(candidates, key=hit_count), field)
+    return getattr(candidates[0], field)
+
+
+def merge_records(records, policy):
+
+    # One record for an ID seen at several sites
+
+    if len(records) == 1:
+        return records[0]
+    lasts = [record.last for record in records if record.last]
+    merged = records[0]._replace(
+        brief=choose(records, 'brief', policy),
+        label=choose(records, 'label', policy),
+        notes=choose(records, 'notes', policy),
+        last=max(lasts) if lasts else None,
+        hits=str(sum(hit_count(record) for record in records)))
+    return merged
+
+
+def merged_records(runs, policy, counts):
+    # Merge the sorted runs and yield one record per ID
+    for key, entries in groupby(heapq.merge(*runs, key=mergeKey), key=mergeKey):
+        records = [entry[4] for entry in entries]
+        if len(records) > 1:
+            counts['shared'] += 1
+        yield merge_records(records, policy)
+
+
+def merge_sites(xmlFiles, settings, policy='recent', workers=None, prefix='merged_'):
+
+    # Merge the sites' XML files into one set of outputs. Sites are in
+    # priority order. Returns the record counts.
+
+    if os.path.exists(settings['ridRulesFile']):
+        rules = load_rules(settings['ridRulesFile'])
+    else:
+        rules = load_rules()
+
+    with tempfile.TemporaryDirectory(prefix='unitrunker_merge_') as tmpDir:
+        jobs = [(site, xmlFile, settings, tmpDir) for site, xmlFile in enumerate(xmlFiles)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            sortedRuns = list(pool.map(sort_site, jobs))
+
+        for xmlFile, (fileName, count) in zip(xmlFiles, sortedRuns):
+            print("  " + xmlFile + ": " + str(count) + " talkgroups and radio IDs")
+
+        runFiles = [open(fileName, 'rb') for fileName, count in sortedRuns]
+        try:
+            counts = {'shared': 0}
+            records = merged_records([read_run(runFile) for runFile in runFiles], policy, counts)
+            sinks = create_sinks(settings)
+            outputNames = output_names(datetime.today().strftime('%Y%m%d'), prefix, sinks)
+            counts.update(export_records(records, sinks, outputNames, settings['createGenericRids'], rules))
+        finally:
+            for runFile in runFiles:
+                runFile.close()
+
+    print("Merged " + str(len(xmlFiles)) + " sites: " + str(counts['talkgroups']) + " talkgroups, "
+          + str(counts['records']) + " radio ID records, " + str(counts['shared']) + " IDs seen at more than one site")
+    return counts
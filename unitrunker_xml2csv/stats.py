@@ -0,0 +1,85 @@
+# Instrumentation for --stats.
+
+import threading
+import time
+
+from .rules import default_rules, find_range
+
+
+class Stats:
+
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()  # The pipeline's threads share the counts
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, name, seconds, calls=1):
+        with self.lock:
+            timer = self.timers.setdefault(name, [0.0, 0])
+            timer[0] += seconds
+            timer[1] += calls
+
+    def timed(self, name, function):
+        perf_counter = time.perf_counter
+        add_time = self.add_time
+
+        def timedFunction(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                add_time(name, perf_counter() - start)
+
+        return timedFunction
+
+    def instrument(self, namespace, names):
+        # Swap timed versions of the named functions into namespace.
+        # Returns a function that puts the originals back.
+        originals = {name: namespace[name] for name in names}
+        for name, function in originals.items():
+            namespace[name] = self.timed(name, function)
+        return lambda: namespace.update(originals)
+
+    def instrument_sink(self, sink):
+        for method in ('system', 'group', 'radio', 'channel', 'close'):
+            setattr(sink, method, self.timed('write.' + sink.key, getattr(sink, method)))
+
+    def iter_timed(self, name, iterable):
+        # Time how long each next() takes - used for the XML parse
+        iterator = iter(iterable)
+        perf_counter = time.perf_counter
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(name, perf_counter() - start, 0)
+                return
+            self.add_time(name, perf_counter() - start)
+            yield item
+
+    def count_radio(self, record, radio, exported, rules):
+        self.count('usersSeen')
+        if radio is None:
+            self.count('usersUnlabelled')
+            return
+        if record.label is None:
+            self.count('usersGenericLabel')
+        if exported:
+            self.count('usersWritten')
+        else:
+            info = find_range((rules or default_rules())['exclude'], int(record.id))
+            self.count('usersExcluded.' + (info['label'] if info else 'unknown'))
+
+    def report(self):
+        return {
+            'totalSeconds': round(time.perf_counter() - self.started, 4),
+            'timers': {name: {'seconds': round(seconds, 4), 'calls': calls}
+                       for name, (seconds, calls) in sorted(self.timers.items())},
+            'counters': dict(sorted(self.counters.items())),
+        }
@@ -0,0 +1,102 @@
+# Watch mode.
+#
+# Unitrunker rewrites its XML while it runs, so wait until the file has
+# stopped changing before exporting again.
+
+from datetime import datetime
+from xml.etree import ElementTree
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+
+from .export import convert
+
+
+def file_signature(fileName):
+    try:
+        stat = os.stat(fileName)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def inotify_waiter(fileName):
+
+    # On Linux use inotify to sleep until something in the XML file's folder
+    # changes. Returns a wait(timeout) function, or None where inotify isn't
+    # available so the caller can fall back to polling.
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        inotifyFd = libc.inotify_init1(os.O_NONBLOCK)
+    except (OSError, AttributeError):
+        return None
+    if inotifyFd < 0:
+        return None
+
+    # IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    mask = 0x002 | 0x008 | 0x080 | 0x100
+    folder = os.path.dirname(os.path.abspath(fileName))
+    if libc.inotify_add_watch(inotifyFd, os.fsencode(folder), mask) < 0:
+        os.close(inotifyFd)
+        return None
+
+    def wait(timeout):
+        ready, unused, unused = select.select([inotifyFd], [], [], timeout)
+        if ready:
+            try:
+                while os.read(inotifyFd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    return wait
+
+
+def wait_until_stable(fileName, settle):
+
+    # Debounce partial writes - wait until the file's mtime and size have
+    # held still for settle seconds. Returns the stable signature.
+
+    signature = file_signature(fileName)
+    while True:
+        time.sleep(settle)
+        latest = file_signature(fileName)
+        if latest == signature:
+            return signature
+        signature = latest
+
+
+def watch(xmlSourceFile, settings, interval=2.0, settle=5.0):
+
+    # Re-export whenever the XML changes. Outputs are only rewritten when
+    # their content changes. Between changes the process sleeps in inotify
+    # (or a slow poll of mtime and size), so it costs next to no CPU.
+
+    wait = inotify_waiter(xmlSourceFile)
+    if wait is None:
+        wait = lambda timeout: time.sleep(interval)
+        timeout = interval
+    else:
+        timeout = 60  # inotify wakes us up, this is only a safety net
+
+    print("Watching " + xmlSourceFile + " - press Ctrl+C to stop")
+    exported = None
+    try:
+        while True:
+            if file_signature(xmlSourceFile) not in (None, exported):
+                signature = wait_until_stable(xmlSourceFile, settle)
+                if signature is not None:
+                    try:
+                        counts = convert(xmlSourceFile, settings, atomic=True)
+                        print(datetime.now().strftime('%H:%M:%S') + " Exported "
+                              + str(counts['records']) + " records")
+                    except ElementTree.ParseError as error:
+                        # Half written file - try again when it changes
+                        print("Skipped incomplete XML: " + str(error))
+                    exported = signature
+            wait(timeout)
+    except KeyboardInterrupt:
+        print("\nStopped watching")